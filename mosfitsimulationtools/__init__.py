@@ -1,3 +1,12 @@
 import plotting
 import analyze
-import simulate
\ No newline at end of file
+import cache
+import columnar
+import jsonio
+import manifest
+import schedule
+import simulate
+import stream
+import sweep
+import timing
+import worker
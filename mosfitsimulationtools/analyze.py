@@ -14,43 +14,302 @@
 # sorts of analysis
 
 
-import json
+import collections
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import warnings
+
 import numpy as np
 
+import columnar
+import jsonio
+import stream
+import timing
+
+
+def is_observed(entry):
+    '''
+    Whether a MOSFiT photometry entry is data rather than a model 
+    realization
+    '''
+    return u'band' in entry and u'magnitude' in entry and (
+        u'realization' not in entry or u'simulated' in entry)
+
+
+class PhotometryTable(object):
+    '''
+    The photometry of a MOSFiT output file, stored as columns. Built in a
+    single pass over the photometry entries.
+
+    Columns (numpy arrays, one element per entry):
+        - time, magnitude, e_magnitude: floats, nan where missing
+        - band, instrument: integer codes into self.bands/self.instruments,
+          -1 where missing
+        - realization: the realization number, 0 for entries without one
+        - observed: True for the data, False for the model realizations
+    '''
+    # the only photometry keys the table needs
+    FIELDS = [u'time', u'magnitude', u'e_magnitude', u'band', u'instrument',
+              u'realization', u'simulated']
+
+    def __init__(self, photometry=()):
+        self.bands = []
+        self.instruments = []
+        band_codes = {}
+        instrument_codes = {}
+
+        time, magnitude, e_magnitude = [], [], []
+        band, instrument, realization, observed = [], [], [], []
+        nan = float('nan')
+        for x in photometry:
+            time.append(x.get(u'time', nan))
+            magnitude.append(x.get(u'magnitude', nan))
+            e_magnitude.append(x.get(u'e_magnitude', nan))
+            name = x.get(u'band')
+            if name is None:
+                band.append(-1)
+            else:
+                if name not in band_codes:
+                    band_codes[name] = len(self.bands)
+                    self.bands.append(name)
+                band.append(band_codes[name])
+            name = x.get(u'instrument')
+            if name is None:
+                instrument.append(-1)
+            else:
+                if name not in instrument_codes:
+                    instrument_codes[name] = len(self.instruments)
+                    self.instruments.append(name)
+                instrument.append(instrument_codes[name])
+            realization.append(x.get(u'realization', 0))
+            observed.append(is_observed(x))
+
+        self.time = np.array(time, dtype=float)
+        self.magnitude = np.array(magnitude, dtype=float)
+        self.e_magnitude = np.array(e_magnitude, dtype=float)
+        self.band = np.array(band, dtype=np.int16)
+        self.instrument = np.array(instrument, dtype=np.int16)
+        self.realization = np.array(realization, dtype=np.int32)
+        self.observed = np.array(observed, dtype=bool)
+
+    def __len__(self):
+        return len(self.time)
+
+    def band_mask(self, band):
+        '''
+        Mask of the entries in the given band (by name)
+        '''
+        if band not in self.bands:
+            return np.zeros(len(self), dtype=bool)
+        return self.band == self.bands.index(band)
+
+    def records(self, mask=None):
+        '''
+        The entries selected by mask rebuilt from the columns of the table as 
+        dictionaries: time, magnitude and e_magnitude (as strings, left out 
+        where missing), band, instrument and realization (left out for the 
+        data). Nothing else MOSFiT writes (u_time, source, system, 
+        telescope, model...) is kept, Single.get_data() and 
+        get_determined_data() give the entries as they are in the file.
+        '''
+        if mask is None:
+            mask = np.ones(len(self), dtype=bool)
+        out = []
+        for i in np.flatnonzero(mask):
+            entry = {}
+            for key, column in ((u'time', self.time),
+                                (u'magnitude', self.magnitude),
+                                (u'e_magnitude', self.e_magnitude)):
+                if not np.isnan(column[i]):
+                    entry[key] = repr(float(column[i]))
+            if self.band[i] >= 0:
+                entry[u'band'] = self.bands[self.band[i]]
+            if self.instrument[i] >= 0:
+                entry[u'instrument'] = self.instruments[self.instrument[i]]
+            if self.realization[i]:
+                entry[u'realization'] = str(self.realization[i])
+            out.append(entry)
+        return out
+
+    def columns(self):
+        '''
+        The table as a dictionary of numpy arrays, see from_columns()
+        '''
+        return {'time': self.time, 'magnitude': self.magnitude,
+                'e_magnitude': self.e_magnitude, 'band': self.band,
+                'instrument': self.instrument,
+                'realization': self.realization, 'observed': self.observed,
+                'bands': np.array(self.bands, dtype=np.unicode_),
+                'instruments': np.array(self.instruments, dtype=np.unicode_)}
+
+    @classmethod
+    def from_columns(cls, columns):
+        '''
+        Rebuilds a table from the output of columns()
+        '''
+        table = cls()
+        for key in ('time', 'magnitude', 'e_magnitude', 'band', 'instrument',
+                    'realization', 'observed'):
+            setattr(table, key, columns[key])
+        table.bands = columns['bands'].tolist()
+        table.instruments = columns['instruments'].tolist()
+        return table
+
+
 class Single(object):
     '''
     Represents the data output by MOSFiT after parameter determination
     '''
-    def __init__(self, freeparamname=" ", trueval=0, datapath=" "):
+    def __init__(self, freeparamname=" ", trueval=0, datapath=" ",
+                 streaming=False, stride=1, realizations=None, cache=None,
+                 params=None):
+        '''
+        streaming: walk the file with stream.read_walkers instead of loading
+        the whole thing, only the parameters and the photometry are kept
+        stride, realizations: keep every stride'th realization, or only the
+        listed (0-indexed) ones
+        cache: a cache.ProductCache to take the parsed file from, or to put
+        it in after parsing
+        params: the parameters to extract, by default every parameter that
+        was free in the fit. The free parameter is always included.
+        '''
         self.free_param = freeparamname
         self.true_val = trueval
         self.data_path = datapath
-        
-    
-        
-        with open(self.data_path, 'r') as f:
-            data = json.loads(f.read())
-            if 'name' not in data:
-                data = data[list(data.keys())[0]]
+        self.load_options = load_options(freeparamname, params, stride, 
+                                         realizations)
+
+        if params is not None:
+            params = sorted(set(params) - set([self.free_param]))
+
+        with timing.span('analyze.parse', path=self.data_path,
+                         streaming=streaming) as fields:
+            fields['cached'] = self._read(params, streaming, stride,
+                                          realizations, cache)
+            fields['realizations'] = len(self.samples)
+            fields['photometry'] = len(self.photometry)
+
+    def _read(self, params, streaming, stride, realizations, cache):
+        '''
+        Fills in the samples and photometry, from the cache if it has them.
+        Returns whether it did.
+        '''
+        if cache is not None:
+            if realizations is not None:
+                realizations = sorted(realizations)
+            entry = cache.entry(self.data_path, (self.free_param, params,
+                                                 stride, realizations))
+            arrays = cache.load(entry)
+            if arrays is not None:
+                self._set_samples(arrays['param_names'].tolist(),
+                                  arrays['samples'])
+                self.photometry = PhotometryTable.from_columns(arrays)
+                return True
+
+        if streaming:
+            data = stream.read_walkers(self.data_path,
+                                       params=[self.free_param] + (params or []),
+                                       free=params is None,
+                                       fields=PhotometryTable.FIELDS,
+                                       stride=stride,
+                                       realizations=realizations)
+            values = data['realizations']
+            photometry = data['photometry']
+        else:
+            values, photometry = self._load(params, stride, realizations)
+
+        # free parameter first, then the rest alphabetically
+        names = [self.free_param]
+        if values:
+            names += sorted(set(values[0]) - set(names))
+        samples = np.array([[i[name] for name in names] for i in values],
+                           dtype=float).reshape(len(values), len(names))
+        self._set_samples(names, samples)
+        self.photometry = PhotometryTable(photometry)
+
+        if cache is not None:
+            arrays = self.photometry.columns()
+            arrays['samples'] = self.samples
+            arrays['param_names'] = np.array(self.param_names,
+                                             dtype=np.unicode_)
+            cache.store(entry, arrays)
+        return False
+
+    @classmethod
+    def from_arrays(cls, freeparamname, trueval, datapath, param_names,
+                    samples, photometry):
+        '''
+        A Single from already parsed samples (realizations x param_names) 
+        and a PhotometryTable, e.g. out of a columnar store
+        '''
+        single = cls.__new__(cls)
+        single.free_param = freeparamname
+        single.true_val = trueval
+        single.data_path = datapath
+        # not known, what it holds is all there is
+        single.load_options = None
+        single._set_samples(list(param_names), samples)
+        single.photometry = photometry
+        return single
+
+    def _set_samples(self, names, samples):
+        self.param_names = names
+        self.param_index = dict((name, i) for i, name in enumerate(names))
+        self.samples = samples
+
+    def _load(self, params, stride, realizations):
+        '''
+        Reads the whole file at once
+        '''
+        data = jsonio.read_event(self.data_path)
     
         
         model = data['models'][0]       
-        realizations = model[u'realizations']
-        param_values = []
-        for i in realizations:
-            val = i[u'parameters'][self.free_param][u'value']
-            param_values.append(val)
-            
-        self.param_vals = param_values
-        
-        photometry = data['photometry']
-        self.data_set = [x for x in photometry if 'band' in x and 'magnitude' in x and (
-            'realization' not in x or 'simulated' in x)]
-        self.models = [x for x in photometry if x not in self.data_set]
+        realizations_all = model[u'realizations']
+        if realizations is not None:
+            keep = set(realizations)
+        else:
+            keep = set(range(0, len(realizations_all), stride))
 
-        
-    def get_param_vals(self):
-        return self.param_vals
+        values = []
+        for n, i in enumerate(realizations_all):
+            if n in keep:
+                values.append(stream.select_parameters(
+                    i[u'parameters'], [self.free_param] + (params or []),
+                    free=params is None))
+
+        photometry = [x for x in data['photometry'] if 'realization' not in x
+                      or int(x['realization']) - 1 in keep]
+
+        return values, photometry
+
+    @property
+    def param_vals(self):
+        return self.samples[:, self.param_index[self.free_param]]
+
+    def get_param_vals(self, param=None):
+        '''
+        The values of a parameter (the free parameter by default) in every
+        realization, a view into the samples
+        '''
+        if param is None:
+            param = self.free_param
+        return self.samples[:, self.param_index[param]]
+
+    def get_param_names(self):
+        return self.param_names
+
+    def get_samples(self, params=None):
+        '''
+        The (realizations x parameters) array of parameter values, columns
+        in the order of params (default: get_param_names())
+        '''
+        if params is None:
+            return self.samples
+        return self.samples[:, [self.param_index[i] for i in params]]
     
     def get_true_val(self):
         return self.true_val
@@ -59,75 +318,752 @@ class Single(object):
         return len(self.param_vals)
     
     
+    def get_photometry(self):
+        '''
+        The PhotometryTable of the data and the determined data
+        '''
+        return self.photometry
+
+    def _original_photometry(self, observed):
+        '''
+        The photometry entries of the walkers.json as they are in the file,
+        read again, the data or those of the realizations this Single holds.
+        Rebuilt from the table (see PhotometryTable.records()) if the file
+        can't be read.
+        '''
+        try:
+            photometry = jsonio.read_event(self.data_path)[u'photometry']
+        except (IOError, OSError, ValueError, KeyError, IndexError) as e:
+            print("Reading the photometry of " + str(self.data_path) + 
+                  " failed (" + str(e) + "), giving the table columns only")
+            mask = self.photometry.observed
+            return self.photometry.records(mask if observed else ~mask)
+        if observed:
+            return [x for x in photometry if is_observed(x)]
+        held = set(self.photometry.realization[~self.photometry.observed]
+                   .tolist())
+        return [x for x in photometry if not is_observed(x) and 
+                int(x.get(u'realization', 0)) in held]
+
     def get_data(self):
         '''
-        The data used for the run
+        The data used for the run, the entries of the walkers.json with 
+        every field, read from the file again (use get_photometry() for 
+        arrays)
         '''
-        return self.data_set
+        return self._original_photometry(True)
         
     def get_determined_data(self):
         '''
-        Determined data
+        Determined data, the entries of the realizations this Single holds 
+        as they are in the walkers.json, read from the file again
         '''
-        return self.models
+        return self._original_photometry(False)
     
-    def get_plotting_vals(self):
+    def get_plotting_vals(self, param=None):
         '''
         Gets the four values needed for plotting:
             - true value
             - q50
             - q_m = q_50-q_16 (minus)
             - q_p = q_84-q_50 (plus)
-            
+
+        param: defaults to the free parameter, for any other parameter the
+        true value is nan
         '''
-        true_val = self.true_val
+        if param is None or param == self.free_param:
+            true_val = self.true_val
+        else:
+            true_val = np.nan
         
-        q16 = np.quantile(self.param_vals, 0.16)
-        q50 = np.quantile(self.param_vals, 0.50)
-        q84 = np.quantile(self.param_vals, 0.84)
+        q16, q50, q84 = np.quantile(self.get_param_vals(param),
+                                    [0.16, 0.50, 0.84])
         
         q_m, q_p = q50-q16, q84-q50
         
         return np.array([true_val, q50, q_m, q_p])
+
+    def get_envelope(self):
+        '''
+        envelope() of the photometry, computed once
+        '''
+        if getattr(self, '_envelope', None) is None:
+            self._envelope = envelope(self.photometry)
+        return self._envelope
     
     
+# quantiles computed by summarize(), as (field name, quantile)
+SUMMARY_QUANTILES = [('q025', 0.025), ('q16', 0.16), ('q50', 0.50),
+                     ('q84', 0.84), ('q975', 0.975)]
+
+SUMMARY_DTYPE = ([('sim', np.int64), ('param', 'U32'), ('true', float),
+                  ('n', np.int64)] +
+                 [(name, float) for name, _ in SUMMARY_QUANTILES] +
+                 [('mean', float), ('std', float), ('bias', float),
+                  ('rmse', float), ('frac_err', float), ('cover68', bool),
+                  ('cover95', bool)])
+
+
+def pad_samples(samples):
+    '''
+    Stacks a list of (realizations x parameters) arrays with different
+    numbers of realizations into one (sims x realizations x parameters)
+    array, padded with nan
+    '''
+    num_params = samples[0].shape[1] if len(samples) else 0
+    longest = max([len(i) for i in samples] + [0])
+    padded = np.full((len(samples), longest, num_params), np.nan)
+    for n, i in enumerate(samples):
+        padded[n, :len(i)] = i
+    return padded
+
+
+def summarize(samples, truths, params=None):
+    '''
+    Summary statistics of the posteriors of many simulations and
+    parameters at once.
+
+    samples: (sims x realizations x parameters) array padded with nan, or a
+    list of (realizations x parameters) arrays
+    truths: (sims x parameters) array of the true values, nan if unknown
+    params: the names of the parameters, for the 'param' field
+
+    Returns a (sims x parameters) structured array with SUMMARY_DTYPE:
+    the quantiles of SUMMARY_QUANTILES, mean and std of the realizations,
+    bias = mean - true, rmse of the realizations about the true value,
+    frac_err = (q50 - true)/true and whether the true value lies within the
+    68% (q16-q84) and 95% (q025-q975) intervals.
+    '''
+    if not isinstance(samples, np.ndarray):
+        samples = pad_samples(samples)
+    truths = np.asarray(truths, dtype=float)
+    num_sims, _, num_params = samples.shape
+    if params is None:
+        params = [str(i) for i in range(num_params)]
+
+    summary = np.zeros((num_sims, num_params), dtype=SUMMARY_DTYPE)
+    summary['sim'] = np.arange(num_sims)[:, None]
+    summary['param'] = np.array(params, dtype=np.unicode_)[None, :]
+    summary['true'] = truths
+    summary['n'] = np.sum(~np.isnan(samples), axis=1)
+    if num_sims == 0 or samples.shape[1] == 0:
+        return summary
+
+    # all-nan slices (parameters a simulation doesn't have) just give nan
+    with warnings.catch_warnings(), np.errstate(invalid='ignore',
+                                                 divide='ignore'):
+        warnings.simplefilter('ignore', RuntimeWarning)
+        quantiles = np.nanquantile(samples, [q for _, q in SUMMARY_QUANTILES],
+                                   axis=1)
+        for (name, _), values in zip(SUMMARY_QUANTILES, quantiles):
+            summary[name] = values
+        summary['mean'] = np.nanmean(samples, axis=1)
+        summary['std'] = np.nanstd(samples, axis=1)
+        summary['bias'] = summary['mean'] - truths
+        summary['rmse'] = np.sqrt(np.nanmean((samples - truths[:, None, :])**2,
+                                             axis=1))
+        summary['frac_err'] = (summary['q50'] - truths)/truths
+        summary['cover68'] = ((summary['q16'] <= truths) &
+                              (truths <= summary['q84']))
+        summary['cover95'] = ((summary['q025'] <= truths) &
+                              (truths <= summary['q975']))
+
+    return summary
+
+
+# quantiles computed by envelope(), as (field name, quantile)
+ENVELOPE_QUANTILES = [('q05', 0.05), ('q16', 0.16), ('q50', 0.50),
+                      ('q84', 0.84), ('q95', 0.95)]
+
+ENVELOPE_DTYPE = ([('band', 'U16'), ('time', float), ('n', np.int64)] +
+                  [(name, float) for name, _ in ENVELOPE_QUANTILES])
+
+
+def envelope(photometry, decimals=6):
+    '''
+    The posterior predictive light curves of a PhotometryTable: for every
+    band and epoch, the ENVELOPE_QUANTILES of the model magnitudes of all
+    realizations at that epoch. Epochs are times rounded to decimals.
+
+    One pass over the table, no loop over the realizations: the model
+    points are sorted by (band, epoch, magnitude) and the quantiles are
+    interpolated between sorted neighbours (like np.quantile).
+
+    Returns a structured array with ENVELOPE_DTYPE, one row per band and 
+    epoch, sorted by band (in order of appearance) and time
+    '''
+    model = np.flatnonzero(~photometry.observed & (photometry.band >= 0) &
+                           np.isfinite(photometry.magnitude) &
+                           np.isfinite(photometry.time))
+    band = photometry.band[model]
+    time = np.round(photometry.time[model], decimals)
+    magnitude = photometry.magnitude[model]
+    order = np.lexsort((magnitude, time, band))
+    band, time, magnitude = band[order], time[order], magnitude[order]
+
+    new_epoch = np.ones(len(model), dtype=bool)
+    new_epoch[1:] = (np.diff(band) != 0) | (np.diff(time) != 0)
+    starts = np.flatnonzero(new_epoch)
+    counts = np.diff(np.append(starts, len(model)))
+
+    result = np.zeros(len(starts), dtype=ENVELOPE_DTYPE)
+    result['band'] = [photometry.bands[i] for i in band[starts]]
+    result['time'] = time[starts]
+    result['n'] = counts
+    for name, q in ENVELOPE_QUANTILES:
+        position = starts + q*(counts - 1)
+        below = np.floor(position).astype(int)
+        above = np.ceil(position).astype(int)
+        result[name] = magnitude[below] + (position - below)*(
+            magnitude[above] - magnitude[below])
+    return result
+
+
+def simulation_label(datapath, n):
+    '''
+    The name of the simulation a walkers.json belongs to, e.g. theta0 for
+    .../theta0/run/products/walkers.json, or sim<n> if it isn't laid out
+    that way
+    '''
+    run = os.path.dirname(os.path.dirname(os.path.abspath(datapath)))
+    label = os.path.basename(os.path.dirname(run))
+    if os.path.basename(run) != 'run' or not label:
+        label = 'sim' + str(n)
+    return label
+
+
+def _signature(path):
+    '''
+    (size, modification time) of a file (or of its compressed version), 
+    None if there is no such file
+    '''
+    try:
+        stat = os.stat(jsonio.resolve(path))
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime
+
+
+def _load_single(job):
+    '''
+    Builds one Single, for Set. Lives at the module level so that it can be
+    handed to a multiprocessing pool. Returns (Single, None) or, if reading
+    the file failed, (None, error message).
+    '''
+    freeparamname, trueval, datapath, options = job
+    try:
+        simulation = Single(freeparamname=freeparamname, trueval=trueval,
+                            datapath=datapath, **options)
+    except Exception as e:
+        return None, type(e).__name__ + ': ' + str(e)
+    return simulation, None
+
+
+def load_options(free_param, params=None, stride=1, realizations=None):
+    '''
+    What of its file a Single with these arguments holds, as a dictionary 
+    that compares equal for the same contents
+    '''
+    if params is not None:
+        params = sorted(set(params) - set([free_param]))
+    if realizations is not None:
+        realizations = sorted(realizations)
+    return {'params': params, 'stride': stride, 'realizations': realizations}
+
+
+def _single_from_arrays(*args):
+    # Single.from_arrays, as something python 2 can pickle
+    return Single.from_arrays(*args)
+
+
+def _nbytes(simulation):
+    '''
+    The memory held by the arrays of a Single
+    '''
+    photometry = simulation.photometry
+    total = simulation.samples.nbytes
+    for column in (photometry.time, photometry.magnitude, 
+                   photometry.e_magnitude, photometry.band, 
+                   photometry.instrument, photometry.realization, 
+                   photometry.observed):
+        total += column.nbytes
+    if getattr(simulation, '_envelope', None) is not None:
+        total += simulation._envelope.nbytes
+    return total
+
+
+class ResidentSingles(object):
+    '''
+    The Singles of a lazy Set, least recently used first. Adding one moves
+    the least recently used others out of memory until the rest fit in 
+    max_bytes (the one just added always stays). Those are written to a
+    temporary directory as they were parsed, and read back from there: a
+    Single comes back as it was put in even if its walkers.json has been
+    rewritten (or broken) since.
+    '''
+    def __init__(self, max_bytes, directory=None):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._singles = collections.OrderedDict() # key: (Single, nbytes)
+        self._spilled = {} # key: .npz file
+        self._count = 0
+        self.directory = tempfile.mkdtemp(prefix='mst_resident_', 
+                                          dir=directory)
+
+    def __len__(self):
+        return len(self._singles)
+
+    def __contains__(self, key):
+        return key in self._singles or key in self._spilled
+
+    def __del__(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def get(self, key):
+        entry = self._singles.pop(key, None)
+        if entry is not None:
+            self._singles[key] = entry
+            return entry[0]
+        if key not in self._spilled:
+            return None
+        with np.load(self._spilled[key]) as arrays:
+            arrays = dict(arrays)
+        simulation = Single.from_arrays(
+            arrays['free_param'].item(), arrays['true_val'].item(), key,
+            arrays['param_names'].tolist(), arrays['samples'],
+            PhotometryTable.from_columns(arrays))
+        self._hold(key, simulation)
+        return simulation
+
+    def put(self, key, simulation):
+        '''
+        Adds simulation, replacing what was kept for key
+        '''
+        self.discard(key)
+        self._hold(key, simulation)
+
+    def _hold(self, key, simulation):
+        size = _nbytes(simulation)
+        self._singles[key] = (simulation, size)
+        self.nbytes += size
+        while self.nbytes > self.max_bytes and len(self._singles) > 1:
+            self._spill(next(iter(self._singles)))
+
+    def _spill(self, key):
+        simulation, size = self._singles.pop(key)
+        self.nbytes -= size
+        if key in self._spilled:
+            return
+        arrays = simulation.photometry.columns()
+        arrays['samples'] = simulation.samples
+        arrays['param_names'] = np.array(simulation.param_names, 
+                                         dtype=np.unicode_)
+        arrays['free_param'] = np.array(simulation.free_param, 
+                                        dtype=np.unicode_)
+        arrays['true_val'] = np.array(simulation.true_val)
+        self._count += 1
+        path = os.path.join(self.directory, str(self._count) + '.npz')
+        np.savez(path, **arrays)
+        self._spilled[key] = path
+
+    def discard(self, key):
+        entry = self._singles.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[1]
+        path = self._spilled.pop(key, None)
+        if path is not None:
+            os.remove(path)
+
+
+class LazySingle(object):
+    '''
+    Stands in for a Single in a Set with a memory budget. The true value,
+    free parameter and path are always there; anything else loads the 
+    Single (from the copy ResidentSingles keeps of it, so as it was when
+    the Set parsed it) and is answered by it.
+    '''
+    def __init__(self, freeparamname, trueval, datapath, options, resident):
+        self.free_param = freeparamname
+        self.true_val = trueval
+        self.data_path = datapath
+        self.load_options = load_options(
+            freeparamname, options.get('params'), options.get('stride', 1),
+            options.get('realizations'))
+        self._options = options
+        self._resident = resident
+
+    def load(self):
+        '''
+        The Single, from memory or from where it was moved to
+        '''
+        simulation = self._resident.get(self.data_path)
+        if simulation is None:
+            simulation = Single(freeparamname=self.free_param,
+                                trueval=self.true_val, 
+                                datapath=self.data_path, **self._options)
+            self._resident.put(self.data_path, simulation)
+        return simulation
+
+    def get_true_val(self):
+        return self.true_val
+
+    def __getattr__(self, name):
+        if name.startswith('__') or name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def __reduce__(self):
+        # goes to other processes as the Single itself
+        simulation = self.load()
+        return (_single_from_arrays, (
+            self.free_param, self.true_val, self.data_path, 
+            simulation.param_names, simulation.samples, 
+            simulation.photometry))
+
+
 class Set(object):
     '''
     Represents a set of single simulations output by MOSFiT after parameter
     determination
     '''
-    def __init__(self, freeparamname, data_path_file):
+    def __init__(self, freeparamname, data_path_file, workers=None,
+                 streaming=False, stride=1, realizations=None, cache=None,
+                 memory_budget=None):
+        '''
+        workers: number of processes to parse the simulations with, the
+        default parses them one after another in this process
+        streaming, stride, realizations, cache: passed on to every Single
+        memory_budget: bytes of samples and photometry to keep in memory.
+        The simulations are then LazySingles: every file is still parsed
+        up front (for the summary of the free parameter and to find the 
+        broken ones) but only the most recently used Singles are kept, 
+        the others are parsed again when needed (a cache makes that 
+        cheap). By default every Single stays in memory.
+
+        Simulations whose files can't be read are reported and left out,
+        get_errors() has the details. refresh() picks up the ones that
+        were written (or rewritten) since.
+        '''
         # the data path file contains a pairing of true_val : run location
         # can be gotten from simulate.Set.get_run_paths()
         self.free_param = freeparamname
+        self.data_path_file = data_path_file
+        self.workers = workers
+        self.options = {'streaming': streaming, 'stride': stride,
+                        'realizations': realizations, 'cache': cache}
+        self.resident = None
+        if memory_budget is not None:
+            self.resident = ResidentSingles(memory_budget)
+        self._read_run_paths()
+
+        # walkers.json path: ((size, mtime) when it was parsed, Single)
+        self._loaded = {}
+        # walkers.json path: (size, mtime) when it failed to parse
+        self._failed = {}
+        # (get_summary arguments, walkers.json path): (Single, its row)
+        self._summary_rows = {}
+        # walkers.json path: {param: true value} for parameters other than
+        # the free one, as restored by from_store()
+        self.truths = {}
+        self.errors = {}
+        self._load([(val, path + "/products/walkers.json")
+                    for val, path in self.run_paths])
+
+    def _read_run_paths(self):
         self.datapaths = {}        
-        f = open(data_path_file, 'r')
+        self.run_paths = [] # (true_val, run location) in file order
+        f = open(self.data_path_file, 'r')
         for line in f:
             val, path = line.split(' ')
             self.datapaths[float(val)] = path
+            self.run_paths.append((float(val), path.strip()))
         f.close()
-    
+
+    def _load(self, todo):
+        '''
+        Parses the walkers.json of (true_val, path) pairs and puts them in 
+        the simulations, in the order of the run paths
+        '''
+        # a lazy Set keeps the last good version of each file until the new
+        # one has parsed
+        signatures = [_signature(path) for _, path in todo]
+        jobs = [(self.free_param, val, path, self.options) 
+                for val, path in todo]
+
+        if self.workers is not None and self.workers > 1 and len(jobs) > 1:
+            pool = multiprocessing.Pool(min(self.workers, len(jobs)))
+            # imap keeps the order of the jobs, and hands the Singles over
+            # as they come so that a lazy Set never holds them all
+            results = pool.imap(_load_single, jobs, chunksize=1)
+        else:
+            pool = None
+            results = (_load_single(job) for job in jobs)
+
+        try:
+            for job, signature, (simulation, error) in zip(jobs, signatures,
+                                                           results):
+                if error is not None:
+                    print("Loading " + job[2] + " failed: " + error)
+                    self.errors[job[1]] = error
+                    self._failed[job[2]] = signature
+                    continue
+                self.errors.pop(job[1], None)
+                self._failed.pop(job[2], None)
+                if self.resident is not None:
+                    self.resident.put(job[2], simulation)
+                    simulation = LazySingle(self.free_param, job[1], job[2],
+                                            self.options, self.resident)
+                    # the summary of the free parameter, while it's loaded
+                    self._summarize([simulation], [self.free_param], {})
+                self._loaded[job[2]] = (signature, simulation)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
         self.simulations = []
-        for val in self.datapaths:
-            walkers = self.datapaths[val].strip() + "/products/walkers.json" 
-            simulation = Single(freeparamname = self.free_param, trueval = val,
-                                datapath = walkers)
-            
-            self.simulations.append(simulation)
+        for val, path in self.run_paths:
+            loaded = self._loaded.get(path + "/products/walkers.json")
+            if loaded is not None:
+                self.simulations.append(loaded[1])
+
+    def refresh(self):
+        '''
+        Brings the Set up to date with the disk while the fits are still 
+        running: new run paths are read from the data path file, and only
+        the walkers.json files that appeared or changed (size or 
+        modification time) since they were parsed are parsed again. 
+        Simulations without one yet are left out as before, a file that 
+        can't be parsed (e.g. halfway written) keeps its last good version.
+
+        Returns the true values of the simulations that changed
+        '''
+        if self.data_path_file is not None:
+            self._read_run_paths()
+        todo = []
+        for val, path in self.run_paths:
+            datapath = path + "/products/walkers.json"
+            signature = _signature(datapath)
+            if signature is None or self._failed.get(datapath) == signature:
+                continue
+            loaded = self._loaded.get(datapath)
+            if loaded is None or loaded[0] != signature:
+                todo.append((val, datapath))
+        if todo:
+            self._load(todo)
+        return [val for val, datapath in todo if datapath in self._loaded
+                and val not in self.errors]
+
+    def watch(self, interval=60., timeout=None):
+        '''
+        Calls refresh() every interval seconds (the first time right away)
+        and yields what it returns, for following a sweep as it goes:
+
+            for changed in results.watch(300):
+                if changed:
+                    plotting.money_plot(results, save=True)
+
+        Runs until timeout seconds have passed, or forever
+        '''
+        start = time.time()
+        while True:
+            yield self.refresh()
+            if timeout is not None and time.time() - start + interval > \
+                    timeout:
+                return
+            time.sleep(interval)
+
+    def pending(self):
+        '''
+        The (true_val, run location) of the simulations not loaded yet
+        '''
+        return [(val, path) for val, path in self.run_paths 
+                if path + "/products/walkers.json" not in self._loaded]
             
-    def get_plotting_vals(self):
-        true = []
-        q50s = []
-        qms = []
-        qps = []
-        for i in self.simulations:
-            true_val, q50, q_m, q_p = i.get_plotting_vals()
-            true.append(true_val)
-            q50s.append(q50)
-            qms.append(q_m)
-            qps.append(q_p)
-
-        return np.array([true, q50s, qms, qps])
+    def export(self, path, truths=None):
+        '''
+        Writes the samples, photometry and true values of every simulation
+        to a columnar store at path (see columnar.py), to be read back with
+        from_store() without touching the walkers.json files again.
+
+        truths: {param: true value} for parameters other than the free one,
+        as in get_summary(), on top of those the Set already knows
+        '''
+        simulations = []
+        ids = set()
+        for n, simulation in enumerate(self.simulations):
+            label = simulation_label(simulation.data_path, n)
+            if label in ids:
+                label += '_' + str(n)
+            ids.add(label)
+            known = dict(self.truths.get(simulation.data_path, {}))
+            known.update(truths or {})
+            simulations.append({
+                'id': label, 'true': simulation.get_true_val(),
+                'truths': known, 'datapath': simulation.data_path,
+                'signature': self._parsed_signature(simulation),
+                'param_names': simulation.get_param_names(),
+                'samples': simulation.get_samples(),
+                'photometry': simulation.get_photometry().columns()})
+        return columnar.write(path, self.free_param, simulations)
+
+    def _parsed_signature(self, simulation):
+        '''
+        The (size, mtime) of the walkers.json of a simulation when it was
+        parsed
+        '''
+        loaded = getattr(self, '_loaded', {}).get(simulation.data_path)
+        if loaded is not None and loaded[1] is simulation:
+            return loaded[0]
+        return _signature(simulation.data_path)
+
+    @classmethod
+    def from_store(cls, path):
+        '''
+        The Set exported to path by export(). The columns of the store are
+        memory mapped: the samples of each simulation are copied out of
+        them, its photometry stays mapped until it is used. The true values
+        of the other parameters are in truths. refresh() parses the 
+        walkers.json files that changed since the export.
+        '''
+        store = columnar.Store(path)
+        results = cls.__new__(cls)
+        results.free_param = store.free_param
+        results.data_path_file = None
+        results.workers = None
+        results.options = {'streaming': False, 'stride': 1,
+                           'realizations': None, 'cache': None}
+        results.datapaths = {}
+        results.run_paths = []
+        results.simulations = []
+        results.errors = {}
+        results._loaded = {}
+        results._failed = {}
+        results._summary_rows = {}
+        results.truths = {}
+        results.resident = None
+        suffix = "/products/walkers.json"
+        for n, entry in enumerate(store.simulations):
+            run = entry['datapath']
+            if run.endswith(suffix):
+                run = run[:-len(suffix)]
+            results.datapaths[entry['true']] = run
+            results.run_paths.append((entry['true'], run))
+
+            columns = store.photometry(n)
+            columns['bands'] = np.array(store.bands, dtype=np.unicode_)
+            columns['instruments'] = np.array(store.instruments,
+                                              dtype=np.unicode_)
+            simulation = Single.from_arrays(
+                store.free_param, entry['true'], entry['datapath'],
+                entry['params'], store.samples(n, entry['params']),
+                PhotometryTable.from_columns(columns))
+            results.simulations.append(simulation)
+            signature = entry.get('signature')
+            results._loaded[entry['datapath']] = (
+                tuple(signature) if signature else None, simulation)
+            results.truths[entry['datapath']] = entry.get('truths', {})
+        return results
+
+    def _summarize(self, simulations, params, truths):
+        '''
+        Puts the summary rows of the simulations that don't have them yet 
+        (for these params and truths) in _summary_rows, so that only the 
+        simulations parsed since the last call are summarized. Returns the
+        key of the rows.
+        '''
+        key = (tuple(params), tuple(sorted(truths.items())))
+        todo = []
+        for simulation in simulations:
+            cached = self._summary_rows.get((key, simulation.data_path))
+            if cached is None or cached[0] is not simulation:
+                todo.append(simulation)
+
+        samples = []
+        true = np.full((len(todo), len(params)), np.nan)
+        for n, simulation in enumerate(todo):
+            columns = np.full((simulation.get_num_realizations(), len(params)),
+                              np.nan)
+            known = self.truths.get(simulation.data_path, {})
+            for m, param in enumerate(params):
+                if param in simulation.param_index:
+                    columns[:, m] = simulation.get_param_vals(param)
+                if param == self.free_param:
+                    true[n, m] = simulation.get_true_val()
+                elif param in truths:
+                    true[n, m] = truths[param]
+                elif param in known:
+                    true[n, m] = known[param]
+            samples.append(columns)
+        if todo:
+            for simulation, row in zip(todo, summarize(samples, true, params)):
+                self._summary_rows[(key, simulation.data_path)] = (simulation,
+                                                                   row)
+        return key
+
+    def get_summary(self, params=None, truths=None):
+        '''
+        summarize() over every simulation, a (simulations x params)
+        structured array.
+
+        params: defaults to the free parameter. Simulations that don't have
+        one of the params get nan for it.
+        truths: {param: true value} for parameters other than the free one
+        (e.g. the fixed parameters of the mock), by default those in 
+        self.truths, others are nan
+        '''
+        if params is None:
+            params = [self.free_param]
+        truths = truths or {}
+        key = self._summarize(self.simulations, params, truths)
+
+        summary = np.zeros((len(self.simulations), len(params)),
+                           dtype=SUMMARY_DTYPE)
+        for n, simulation in enumerate(self.simulations):
+            summary[n] = self._summary_rows[(key, simulation.data_path)][1]
+        summary['sim'] = np.arange(len(self.simulations))[:, None]
+        return summary
+
+    def get_plotting_vals(self, param=None):
+        '''
+        The true values, q50, q50-q16 and q84-q50 of every simulation
+        '''
+        summary = self.get_summary([param or self.free_param])[:, 0]
+        return np.array([summary['true'], summary['q50'],
+                         summary['q50'] - summary['q16'],
+                         summary['q84'] - summary['q50']])
+
+    def get_envelopes(self):
+        '''
+        Single.get_envelope() of every simulation, in order
+        '''
+        return [simulation.get_envelope() for simulation in self.simulations]
 
     def get_simulations(self):
         return self.simulations
+
+    def get_memory_usage(self):
+        '''
+        Bytes of samples and photometry held in memory by the simulations
+        '''
+        if self.resident is not None:
+            return self.resident.nbytes
+        return sum(_nbytes(simulation) for simulation in self.simulations)
+
+    def get_timing_summary(self, events=None):
+        '''
+        timing.summarize() of the parsing of the simulations of this Set. 
+        The events are read from the current timing file unless given.
+        '''
+        if events is None:
+            events = timing.read_events()
+        paths = set(path + "/products/walkers.json" 
+                    for _, path in self.run_paths)
+        return timing.summarize([e for e in events if e.get('path') in paths],
+                                label='path')
+
+    def get_errors(self):
+        '''
+        {true_val: error message} for the simulations that failed to load
+        '''
+        return self.errors
@@ -0,0 +1,232 @@
+# MOSFiT Simulation Tools
+# cache.py
+# python2
+
+# MOSFiT  (https://github.com/SSantosLab/MOSFiT) REQUIRED
+# Built to work with the kasen_model model in MOSFIT (found in the SSantosLab
+# github)
+
+# Parsing a walkers.json is by far the slowest part of loading a Set, and
+# the files don't change once MOSFiT is done with them. ProductCache keeps
+# what analyze.Single extracts from each file as an .npz, so the next load
+# of the same file is a numpy read.
+
+# Generating a mock is the slowest part of creating a simulate.Set, and the
+# same mocks are generated again and again for overlapping grids.
+# GenerationStore keeps the output of every generative run so it is only
+# ever made once.
+
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+import jsonio
+
+# bump when the arrays stored by analyze.Single change
+VERSION = 2
+
+
+def _digest(text):
+    if not isinstance(text, bytes):
+        text = text.encode('utf-8')
+    return hashlib.sha1(text).hexdigest()
+
+
+def file_identity(path):
+    '''
+    The (path, size, mtime, content hash) of a file. Any rewrite of the file
+    by MOSFiT changes at least one of these.
+    '''
+    path = os.path.abspath(jsonio.resolve(path))
+    stat = os.stat(path)
+    content = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            content.update(block)
+    return path, stat.st_size, repr(stat.st_mtime), content.hexdigest()
+
+
+class ProductCache(object):
+    '''
+    A directory of .npz files holding the arrays extracted from MOSFiT
+    products, keyed by the identity of the product file. Once the directory
+    grows past max_bytes the least recently used entries are deleted.
+    '''
+    def __init__(self, directory, max_bytes=2 * 1024**3):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        _makedirs(self.directory)
+
+    def entry(self, path, options=()):
+        '''
+        The file the entry for path (and the options it was extracted with)
+        lives in: <path hash>_<identity hash>_<options hash>.npz, so that 
+        the entries for older versions of the same file can be found and 
+        removed, and the entries for other options of this version kept.
+        '''
+        identity = file_identity(path)
+        prefix = _digest(identity[0])[:16]
+        version = _digest(repr((VERSION, identity)))[:16]
+        key = _digest(repr(options))[:16]
+        return os.path.join(self.directory, 
+                            prefix + '_' + version + '_' + key + '.npz')
+
+    def load(self, entry):
+        '''
+        The arrays stored in an entry, or None if there is no such entry
+        '''
+        try:
+            with np.load(entry) as stored:
+                arrays = dict((k, stored[k]) for k in stored.files)
+        except (IOError, OSError, ValueError):
+            return None
+        try:
+            os.utime(entry, None) # mark as recently used
+        except OSError:
+            pass
+        return arrays
+
+    def store(self, entry, arrays):
+        '''
+        Saves the arrays to an entry, removing the entries of older versions
+        of the same file (whatever their options)
+        '''
+        prefix, version = os.path.basename(entry).split('_')[:2]
+        for other in os.listdir(self.directory):
+            parts = other.split('_')
+            if parts[0] == prefix and parts[1:2] != [version]:
+                _remove(os.path.join(self.directory, other))
+
+        # write to a temporary file first so a reader never sees half an entry
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **arrays)
+            os.rename(tmp, entry)
+        except Exception:
+            _remove(tmp)
+            raise
+
+        self.evict()
+        return entry
+
+    def evict(self):
+        '''
+        Deletes least recently used entries until the cache fits in max_bytes
+        '''
+        entries = [os.path.join(self.directory, name)
+                   for name in os.listdir(self.directory)
+                   if name.endswith('.npz')]
+        evict_lru(entries, self.max_bytes, _remove)
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz'):
+                _remove(os.path.join(self.directory, name))
+
+
+class GenerationStore(object):
+    '''
+    Keeps the products/walkers.json of generative MOSFiT runs, addressed by 
+    a hash of everything that went into the run (simulate.Single.
+    get_generation_key()). A Single generating a configuration that is 
+    already in the store gets a hard link to (or a copy of) the stored file 
+    instead of running MOSFiT again. Least recently used runs are deleted 
+    once the store grows past max_bytes.
+    '''
+    PRODUCT = 'walkers.json'
+
+    def __init__(self, directory, max_bytes=10 * 1024**3):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        _makedirs(self.directory)
+
+    def _product(self, key):
+        return os.path.join(self.directory, key, self.PRODUCT)
+
+    def fetch(self, key, destination):
+        '''
+        Puts the stored product for key at destination. Returns False if
+        there is none.
+        '''
+        product = self._product(key)
+        if not os.path.isfile(product):
+            return False
+        _makedirs(os.path.dirname(destination))
+        _remove(destination)
+        try:
+            os.link(product, destination)
+        except OSError: # other file system, or no hard links
+            shutil.copyfile(product, destination)
+        try:
+            os.utime(product, None) # mark as recently used
+        except OSError:
+            pass
+        return True
+
+    def add(self, key, source):
+        '''
+        Stores the product at source under key
+        '''
+        entry = os.path.join(self.directory, key)
+        _makedirs(entry)
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=entry)
+        os.close(fd)
+        try:
+            shutil.copyfile(source, tmp)
+            os.rename(tmp, self._product(key))
+        except Exception:
+            _remove(tmp)
+            raise
+        self.evict()
+
+    def evict(self):
+        '''
+        Deletes least recently used runs until the store fits in max_bytes
+        '''
+        entries = [self._product(key) for key in os.listdir(self.directory)]
+        evict_lru(entries, self.max_bytes, self._remove_entry)
+
+    def _remove_entry(self, product):
+        shutil.rmtree(os.path.dirname(product), ignore_errors=True)
+
+
+def evict_lru(paths, max_bytes, remove):
+    '''
+    Calls remove on the least recently modified of paths until the rest add
+    up to at most max_bytes
+    '''
+    entries = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        remove(path)
+        total -= size
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+
+
+def _remove(path):
+    # another process may have got there first
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,250 @@
+# MOSFiT Simulation Tools
+# columnar.py
+# python2
+
+# MOSFiT  (https://github.com/SSantosLab/MOSFiT) REQUIRED
+# Built to work with the kasen_model model in MOSFIT (found in the SSantosLab
+# github)
+
+# One store for the results of a whole Set, instead of the walkers.json of
+# every simulation. A store is a directory of numpy columns:
+#   index.json           the simulations (ID, true value, true values of
+#                        the other parameters, data path and its size and
+#                        mtime, fitted parameters and the rows of each in 
+#                        the columns below), the parameter, band and 
+#                        instrument names
+#   samples.npy          (realizations x parameters) posterior samples of
+#                        every simulation, one after the other, nan where a
+#                        simulation doesn't have a parameter
+#   truths.npy           (simulations x parameters) true values, nan where
+#                        unknown
+#   <column>.npy         the photometry columns of analyze.PhotometryTable,
+#                        every simulation one after the other
+# Columns are read with np.load(mmap_mode='r'), so only the pages of the
+# columns and simulations that are used are ever read from disk.
+#
+# Written through analyze.Set.export(), read with analyze.Set.from_store()
+# or Store for queries across simulations.
+
+
+import json
+import numbers
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+VERSION = 1
+
+INDEX_FILE = 'index.json'
+
+PHOTOMETRY_COLUMNS = ['time', 'magnitude', 'e_magnitude', 'band',
+                      'instrument', 'realization', 'observed']
+
+
+def _recode(codes, names, all_names):
+    '''
+    codes into names as codes into all_names (adding the missing names)
+    '''
+    lookup = []
+    for name in names:
+        if name not in all_names:
+            all_names.append(name)
+        lookup.append(all_names.index(name))
+    lookup = np.array(lookup + [-1], dtype=codes.dtype)
+    # -1 (missing) picks the last element, which stays -1
+    return lookup[codes]
+
+
+def write(path, free_param, simulations):
+    '''
+    Writes a store. simulations is a list of dictionaries with
+        - id: a name for the simulation, unique in the Set
+        - true: the true value of the free parameter
+        - truths: {param: true value} for other parameters (optional)
+        - datapath: the walkers.json it came from
+        - signature: (size, mtime) of that file when it was parsed 
+          (optional)
+        - param_names, samples: the posterior samples and their columns
+        - photometry: a dictionary of PHOTOMETRY_COLUMNS, with codes into
+          its 'bands' and 'instruments'
+
+    The store is built next to path and moved into place at the end, so an
+    existing store at path is only ever replaced by a complete one.
+    '''
+    path = os.path.abspath(path)
+    params = [free_param]
+    for simulation in simulations:
+        for name in simulation['param_names']:
+            if name not in params:
+                params.append(name)
+    column = dict((name, i) for i, name in enumerate(params))
+
+    bands, instruments = [], []
+    index = {'version': VERSION, 'free_param': free_param, 'params': params,
+             'bands': bands, 'instruments': instruments, 'simulations': []}
+
+    samples, truths = [], []
+    photometry = dict((name, []) for name in PHOTOMETRY_COLUMNS)
+    sample_row = photometry_row = 0
+    for simulation in simulations:
+        values = np.full((len(simulation['samples']), len(params)), np.nan)
+        values[:, [column[name] for name in simulation['param_names']]] = \
+            simulation['samples']
+        samples.append(values)
+
+        known = dict((str(name), float(value)) for name, value in 
+                     (simulation.get('truths') or {}).items() 
+                     if name != free_param)
+        true = np.full(len(params), np.nan)
+        for name, value in known.items():
+            if name in column:
+                true[column[name]] = value
+        true[0] = simulation['true']
+        truths.append(true)
+
+        table = simulation['photometry']
+        for name in PHOTOMETRY_COLUMNS:
+            values_ = table[name]
+            if name == 'band':
+                values_ = _recode(values_, table['bands'], bands)
+            elif name == 'instrument':
+                values_ = _recode(values_, table['instruments'], instruments)
+            photometry[name].append(values_)
+
+        rows = len(table['time'])
+        index['simulations'].append({
+            'id': simulation['id'], 'true': simulation['true'],
+            'truths': known,
+            'datapath': simulation['datapath'],
+            'signature': simulation.get('signature'),
+            'params': list(simulation['param_names']),
+            'samples': [sample_row, sample_row + len(values)],
+            'photometry': [photometry_row, photometry_row + rows]})
+        sample_row += len(values)
+        photometry_row += rows
+
+    directory = os.path.dirname(path)
+    tmp = tempfile.mkdtemp(prefix='.store_', dir=directory)
+    try:
+        np.save(os.path.join(tmp, 'samples.npy'),
+                np.concatenate(samples) if samples else
+                np.zeros((0, len(params))))
+        np.save(os.path.join(tmp, 'truths.npy'),
+                np.array(truths).reshape(len(truths), len(params)))
+        for name in PHOTOMETRY_COLUMNS:
+            values = photometry[name]
+            np.save(os.path.join(tmp, name + '.npy'),
+                    np.concatenate(values) if values else np.zeros(0))
+        with open(os.path.join(tmp, INDEX_FILE), 'w') as f:
+            json.dump(index, f, indent=1)
+
+        # swap the new store in
+        old = None
+        if os.path.exists(path):
+            old = tempfile.mkdtemp(prefix='.old_store_', dir=directory)
+            os.rename(path, os.path.join(old, 'store'))
+        os.rename(tmp, path)
+        if old is not None:
+            shutil.rmtree(old, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return path
+
+
+class Store(object):
+    '''
+    A store written by write(). Columns are memory mapped when first asked
+    for, and simulations are found by ID or position.
+    '''
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        with open(os.path.join(self.path, INDEX_FILE), 'r') as f:
+            index = json.load(f)
+        if index['version'] != VERSION:
+            raise ValueError('Store version ' + str(index['version']) +
+                             ', expected ' + str(VERSION))
+        self.free_param = index['free_param']
+        self.params = index['params']
+        self.bands = index['bands']
+        self.instruments = index['instruments']
+        self.simulations = index['simulations']
+        self.ids = dict((simulation['id'], n)
+                        for n, simulation in enumerate(self.simulations))
+        self.param_index = dict((name, i) for i, name in
+                                enumerate(self.params))
+        self._columns = {}
+
+    def __len__(self):
+        return len(self.simulations)
+
+    def column(self, name):
+        '''
+        A whole column ('samples', 'truths' or a photometry column), memory
+        mapped
+        '''
+        if name not in self._columns:
+            self._columns[name] = np.load(
+                os.path.join(self.path, name + '.npy'), mmap_mode='r')
+        return self._columns[name]
+
+    def _position(self, sim):
+        if isinstance(sim, numbers.Integral):
+            return sim
+        return self.ids[sim]
+
+    def samples(self, sim=None, params=None):
+        '''
+        The posterior samples of a simulation (by ID or position, all of
+        them if None) for params (all by default), (realizations x params)
+        '''
+        samples = self.column('samples')
+        if sim is not None:
+            start, stop = self.simulations[self._position(sim)]['samples']
+            samples = samples[start:stop]
+        if params is None:
+            return samples
+        return samples[:, [self.param_index[name] for name in params]]
+
+    def sample_sims(self):
+        '''
+        The position of the simulation of every row of samples()
+        '''
+        counts = [stop - start
+                  for start, stop in (s['samples'] for s in self.simulations)]
+        return np.repeat(np.arange(len(self.simulations)), counts)
+
+    def find(self, low=None, high=None):
+        '''
+        The positions of the simulations whose true value of the free
+        parameter is in [low, high]
+        '''
+        true = np.array([simulation['true']
+                         for simulation in self.simulations], dtype=float)
+        keep = np.ones(len(true), dtype=bool)
+        if low is not None:
+            keep &= true >= low
+        if high is not None:
+            keep &= true <= high
+        return np.flatnonzero(keep)
+
+    def truths(self, params=None):
+        '''
+        (simulations x params) true values of fitted parameters (those of 
+        the others are in the 'truths' of each simulation)
+        '''
+        truths = self.column('truths')
+        if params is None:
+            return truths
+        return truths[:, [self.param_index[name] for name in params]]
+
+    def photometry(self, sim, columns=None):
+        '''
+        {column: values} of the photometry of one simulation, by default of
+        every column
+        '''
+        start, stop = self.simulations[self._position(sim)]['photometry']
+        return dict((name, self.column(name)[start:stop])
+                    for name in (columns or PHOTOMETRY_COLUMNS))
@@ -0,0 +1,260 @@
+# MOSFiT Simulation Tools
+# jsonio.py
+# python2
+
+# MOSFiT  (https://github.com/SSantosLab/MOSFiT) REQUIRED
+# Built to work with the kasen_model model in MOSFIT (found in the SSantosLab
+# github)
+
+# Reading and writing of MOSFiT event files (mock inputs, walkers.json), for
+# the whole package.
+#
+# The JSON codec is the fastest one installed: orjson, ujson, simplejson or
+# the json of the standard library, in that order (set_backend() picks one).
+# Files are read as bytes in one go and handed to the codec as they are, not
+# decoded to text first.
+#
+# Files may be compressed: a name ending in .gz is gzip, .zst is zstandard
+# (needs the zstandard package), and reading also recognizes compressed
+# contents by their first bytes whatever the name. A path that doesn't exist
+# is read from path.gz or path.zst if one of those does, so products can be
+# compressed after the fits without anything else changing:
+#
+#   jsonio.compress('run/products/walkers.json')   # -> walkers.json.gz
+#   analyze.Single('theta', 0.5, 'run/products/walkers.json')  # still works
+#
+# Files are written compact (no indentation) unless asked otherwise, and
+# through a temporary file, so a crash never leaves half a file behind.
+
+
+import gzip
+import io
+import os
+import sys
+import tempfile
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# suffix: compression
+COMPRESSIONS = {'.gz': 'gzip', '.zst': 'zstd'}
+
+# the codecs this module can use, fastest first
+BACKENDS = ['orjson', 'ujson', 'simplejson', 'json']
+
+_codec = None
+_loads = None
+backend = None
+
+
+def set_backend(name=None):
+    '''
+    Uses the codec name (one of BACKENDS), by default the first one of them
+    that is installed
+    '''
+    global _codec, _loads, backend
+    names = BACKENDS if name is None else [name]
+    for candidate in names:
+        try:
+            module = __import__(candidate)
+        except ImportError:
+            continue
+        _codec, _loads, backend = module, module.loads, candidate
+        if candidate == 'ujson':
+            try:
+                # older ujson rounds floats unless asked not to
+                module.loads('1.0', precise_float=True)
+                _loads = lambda data: module.loads(data, precise_float=True)
+            except TypeError:
+                pass
+        return backend
+    raise ImportError('JSON backend ' + str(name) + ' is not installed')
+
+
+set_backend()
+
+
+def loads(data):
+    '''
+    Parses JSON from bytes or text
+    '''
+    if backend == 'json' and sys.version_info[0] == 3 and \
+            not isinstance(data, str):
+        data = bytes(data).decode('utf-8')
+    return _loads(data)
+
+
+def dumps(obj, indent=None, sort_keys=False):
+    '''
+    obj as UTF-8 encoded JSON bytes, compact unless indent is given
+    '''
+    if backend == 'orjson':
+        option = 0
+        if indent is not None:
+            option |= _codec.OPT_INDENT_2
+        if sort_keys:
+            option |= _codec.OPT_SORT_KEYS
+        return _codec.dumps(obj, option=option)
+    if backend == 'ujson':
+        text = _codec.dumps(obj, indent=indent or 0, sort_keys=sort_keys,
+                            ensure_ascii=False)
+    else:
+        separators = (',', ':') if indent is None else (',', ': ')
+        text = _codec.dumps(obj, indent=indent, sort_keys=sort_keys,
+                            separators=separators)
+    if not isinstance(text, bytes):
+        text = text.encode('utf-8')
+    return text
+
+
+def resolve(path):
+    '''
+    path, or its compressed version (path.gz, path.zst) if only that exists
+    '''
+    if os.path.exists(path):
+        return path
+    for suffix in sorted(COMPRESSIONS):
+        if os.path.exists(path + suffix):
+            return path + suffix
+    return path
+
+
+def _compression(path, head=b''):
+    for suffix, compression in COMPRESSIONS.items():
+        if path.endswith(suffix):
+            return compression
+    if head.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if head.startswith(ZSTD_MAGIC):
+        return 'zstd'
+    return None
+
+
+def _zstandard():
+    if zstandard is None:
+        raise ImportError('Reading and writing .zst files needs the '
+                          'zstandard package')
+    return zstandard
+
+
+def open_binary(path):
+    '''
+    The (uncompressed) contents of a file as a binary file object, see
+    resolve() for which file
+    '''
+    path = resolve(path)
+    f = open(path, 'rb')
+    compression = _compression(path, f.read(4))
+    f.seek(0)
+    if compression == 'gzip':
+        f.close()
+        return gzip.open(path, 'rb')
+    if compression == 'zstd':
+        return _zstandard().ZstdDecompressor().stream_reader(f)
+    return f
+
+
+def open_text(path):
+    '''
+    open_binary() as text, for reading in pieces (see stream.py)
+    '''
+    f = open_binary(path)
+    if sys.version_info[0] == 2:
+        return f
+    return io.TextIOWrapper(f, encoding='utf-8')
+
+
+def read_bytes(path):
+    '''
+    The (uncompressed) contents of a file, read in one go
+    '''
+    path = resolve(path)
+    with open(path, 'rb') as f:
+        data = f.read()
+    compression = _compression(path, data[:4])
+    if compression == 'gzip':
+        with gzip.GzipFile(fileobj=io.BytesIO(data), mode='rb') as g:
+            return g.read()
+    if compression == 'zstd':
+        return _zstandard().ZstdDecompressor().decompressobj().decompress(
+            data)
+    return data
+
+
+def load(path):
+    return loads(read_bytes(path))
+
+
+def read_event(path):
+    '''
+    The event of a MOSFiT file, which holds either the event itself or
+    {name: event} (only the first one is returned)
+    '''
+    data = load(path)
+    if 'name' not in data:
+        data = data[list(data.keys())[0]]
+    return data
+
+
+def _write(path, data, compression):
+    if compression == 'gzip':
+        buffer = io.BytesIO()
+        with gzip.GzipFile(fileobj=buffer, mode='wb') as g:
+            g.write(data)
+        data = buffer.getvalue()
+    elif compression == 'zstd':
+        data = _zstandard().ZstdCompressor().compress(data)
+
+    path = os.path.abspath(path)
+    fd, tmp = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.',
+                               dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp, 0o644)
+        os.rename(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def dump(obj, path, indent=None, sort_keys=False):
+    '''
+    Writes obj to path as JSON, compact unless indent is given, compressed
+    if path ends in .gz or .zst
+    '''
+    _write(path, dumps(obj, indent=indent, sort_keys=sort_keys),
+           _compression(path))
+
+
+def compress(path, compression='gzip', keep=False):
+    '''
+    Compresses the file at path to path.gz (or path.zst), removing the
+    original unless keep. Returns the new path.
+    '''
+    suffix = dict((v, k) for k, v in COMPRESSIONS.items())[compression]
+    with open(path, 'rb') as f:
+        _write(path + suffix, f.read(), compression)
+    if not keep:
+        os.remove(path)
+    return path + suffix
+
+
+def decompress(path, keep=False):
+    '''
+    The reverse of compress(): writes the contents of path.gz (or .zst) to
+    path. Returns the new path.
+    '''
+    source = resolve(path)
+    if source == path:
+        return path
+    _write(path, read_bytes(source), None)
+    if not keep:
+        os.remove(source)
+    return path
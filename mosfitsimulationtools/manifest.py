@@ -0,0 +1,167 @@
+# MOSFiT Simulation Tools
+# manifest.py
+# python2
+
+# MOSFiT  (https://github.com/SSantosLab/MOSFiT) REQUIRED
+# Built to work with the kasen_model model in MOSFIT (found in the SSantosLab
+# github)
+
+# A record of how far every simulation of a simulate.Set got, kept on disk so
+# that a Set whose process (or machine) died can pick up where it stopped.
+# The manifest is a JSON-lines file that is only ever appended to: every
+# change of phase of a simulation is one line, written with a single write
+# and synced to disk before the work goes on. A line cut off by a crash is
+# ignored when the manifest is read back, the last complete line of a
+# simulation is its state.
+
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+import jsonio
+import stream
+
+# the phases of a simulation, in order
+GENERATED = 'generated'         # MOSFiT made the mock observations
+INPUT_WRITTEN = 'input_written' # the input file of the fit is written
+FITTING = 'fitting'             # the fit was started
+DONE = 'done'                   # the fit left a valid walkers.json
+FAILED = 'failed'               # generating or fitting failed
+PHASES = [GENERATED, INPUT_WRITTEN, FITTING, DONE, FAILED]
+
+
+def valid_walkers(path):
+    '''
+    Whether path is a complete MOSFiT output: a JSON file that parses to the
+    end and holds at least one realization. MOSFiT killed halfway leaves
+    no file or a cut off one.
+    '''
+    path = jsonio.resolve(path)
+    if not os.path.isfile(path) or os.path.getsize(path) == 0:
+        return False
+    try:
+        walkers = stream.read_walkers(path, params=[], fields=[])
+    except (ValueError, KeyError, StopIteration, IOError):
+        return False
+    return len(walkers['realizations']) > 0
+
+
+class Manifest(object):
+    '''
+    The manifest of a Set, kept in the JSON-lines file at path. Each line is
+    {'id': ..., 'phase': ..., 'time': ..., other fields}. The state of a
+    simulation is all the fields ever recorded for it, later lines winning.
+    '''
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self._lock = threading.Lock()
+        # the states folded from the file so far: the file is only ever
+        # appended to, so only the lines past _offset need reading, unless
+        # the file was replaced (compacted) since
+        self._states = {}
+        self._inode = None
+        self._offset = 0
+
+    def record(self, sim_id, phase, **fields):
+        '''
+        Appends a change of phase of simulation sim_id, with any other fields
+        (name, product paths...) worth keeping
+        '''
+        if phase not in PHASES:
+            raise ValueError('Unknown phase ' + str(phase))
+        fields.update({'id': sim_id, 'phase': phase, 'time': time.time()})
+        line = (json.dumps(fields, sort_keys=True) + '\n').encode('utf-8')
+        with self._lock:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                         0o644)
+            try:
+                os.write(fd, line)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _update(self):
+        '''
+        Folds the lines appended since the last call (by this process or
+        any other) into _states. Call with the lock held.
+        '''
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            self._states, self._inode, self._offset = {}, None, 0
+            return
+        if stat.st_ino != self._inode or stat.st_size < self._offset:
+            self._states, self._inode, self._offset = {}, stat.st_ino, 0
+        if stat.st_size == self._offset:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        # a last line without its newline is still being written (or was
+        # cut off), it's read again next time
+        end = data.rfind(b'\n') + 1
+        self._offset += end
+        for line in data[:end].splitlines():
+            try:
+                fields = json.loads(line.decode('utf-8'))
+            except ValueError:
+                continue # cut off by a crash
+            state = self._states.setdefault(fields['id'], {'times': {}})
+            state['times'][fields['phase']] = fields['time']
+            state.update(fields)
+
+    @staticmethod
+    def _copy(state):
+        state = dict(state)
+        state['times'] = dict(state['times'])
+        return state
+
+    def entries(self):
+        '''
+        {id: state} of every simulation in the manifest. A state holds the
+        latest value of every field and 'times', {phase: time} of the last
+        time each phase was entered.
+        '''
+        with self._lock:
+            self._update()
+            return dict((sim_id, self._copy(state)) 
+                        for sim_id, state in self._states.items())
+
+    def get(self, sim_id):
+        '''
+        The state of one simulation, None if it was never recorded. Only
+        reads what was appended since the last call.
+        '''
+        with self._lock:
+            self._update()
+            state = self._states.get(sim_id)
+            return None if state is None else self._copy(state)
+
+    def compact(self):
+        '''
+        Rewrites the manifest with one line per simulation. The new file
+        replaces the old one in one rename, so the manifest stays whole if
+        this is interrupted.
+        '''
+        with self._lock:
+            self._update()
+            states = self._states
+            directory = os.path.dirname(self.path)
+            fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=directory)
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    for sim_id in sorted(states):
+                        f.write(json.dumps(states[sim_id], sort_keys=True) +
+                                '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.rename(tmp, self.path)
+            except Exception:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+                raise
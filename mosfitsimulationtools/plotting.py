@@ -11,102 +11,132 @@
 # Plotting Tools for Mosfit Simulation Tools
 
 import corner
+import hashlib
+import matplotlib
 import matplotlib.pyplot as plt
-import json 
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+import multiprocessing
+import os
 plt.switch_backend('agg')
 import numpy as np
 import seaborn as sns
 
+import analyze
+import jsonio
+import timing
+
 class Plotting(object):
 
     def __init__(self):
         # Does every class need a init? I'm not sure so here it is, just in case
         pass
     
-    def single_corner(self, analyze_single, name='corner.png', save=False, theta=True):
+    @timing.timed('plotting.single_corner')
+    def single_corner(self, analyze_single, name='corner.png', save=False, theta=True, fig=None):
         '''
         Makes a smoll corner plot for the simulation
         
         analyze_single: a Single object from analyze.py 
+        fig: a Figure to draw on instead of a new pyplot figure
         '''
         if theta:
-           plt.rcParams["font.family"] = "serif"
-           plt.rcParams.update({'font.size': 12})
-           cfig = plt.figure(figsize=(8,10))
-            
+           if fig is None:
+               # corner makes the figure
+               plt.rcParams["font.family"] = "serif"
+               plt.rcParams.update({'font.size': 12})
             
            sim_results = np.array(analyze_single.get_param_vals())*180/np.pi
            
            cfig = corner.corner(sim_results, quantiles=[.16, .50, .84], 
-                         show_titles=True, labels=[r'$\theta_{meas}$'])
+                         show_titles=True, labels=[r'$\theta_{meas}$'], fig=fig)
            cfig.axes[0].axvline(analyze_single.get_true_val(), color='red')
            cfig.suptitle(r'$\theta_{true}$ = ' +"{:.0f}".format(analyze_single.get_true_val()*180./np.pi), fontsize=16)
-           plt.tight_layout(pad=1.7)
-	   if save:
-	       plt.savefig(name, dpi=300)
+           cfig.tight_layout(pad=1.7)
+           if save:
+               cfig.savefig(name, dpi=300)
 
            return cfig
         else:
             return 0 
         
        
-    def single_comparison(self,analyze_single, name='comparison.png', save=False):
+    @timing.timed('plotting.single_comparison')
+    def single_comparison(self,analyze_single, name='comparison.png', save=False, ax=None, envelope=False):
         '''
         Make a comparison plot of the input data and the walkers on a 
         magnitude vs. MJD plot
         
         analyze_single: a Single object from analyze.py
+        ax: an Axes to draw on instead of a new pyplot figure
+        envelope: instead of every walker, draw the median light curve with
+        the 16-84% and 5-95% ranges of the walkers shaded (see 
+        analyze.envelope), which takes the same time for any number of walkers
         '''
      
-        sns.reset_orig()
-        plt.rcParams["font.family"] = "serif"
-        plt.rcParams.update({'font.size': 14})
-
-        fig = plt.figure(figsize=(12,8))
-        plt.gca().invert_yaxis()
-        plt.gca().set_xlim(0,4)
-        #plt.gca().set_ylim(bottom=25, top=19)
-        plt.gca().set_xlabel('MJD')
-        plt.gca().set_ylabel('Apparent Magnitude')
-
-        real_data = analyze_single.get_data()
-        instruments = [] # should only ever be one instrument 
-        bands = []
-        
-        for i in real_data:
-            if i[u'band'] not in bands:
-                bands.append(i[u'band'])
-            if i[u'instrument'] not in instruments:
-                instruments.append(i[u'instrument'])
-            
-        fake_data = analyze_single.get_determined_data()
-        num_realizations = analyze_single.get_num_realizations()
+        if ax is None:
+            sns.reset_orig()
+            plt.rcParams["font.family"] = "serif"
+            plt.rcParams.update({'font.size': 14})
+
+            fig = plt.figure(figsize=(12,8))
+            ax = plt.gca()
+        ax.invert_yaxis()
+        ax.set_xlim(0,4)
+        #ax.set_ylim(bottom=25, top=19)
+        ax.set_xlabel('MJD')
+        ax.set_ylabel('Apparent Magnitude')
+
+        photometry = analyze_single.get_photometry()
+        observed = photometry.observed
+        # should only ever be one instrument 
+        instrument = photometry.instruments[photometry.instrument[observed][0]]
+        # bands in the order they appear in the data
+        codes, first = np.unique(photometry.band[observed], return_index=True)
+        bands = [photometry.bands[i] for i in codes[np.argsort(first)]]
         
+        if envelope:
+            quantiles = analyze_single.get_envelope()
+        else:
+            # Group the simulated points by band, then realization, keeping 
+            # the file order inside each curve (lexsort is stable)
+            model = np.flatnonzero(~observed & (photometry.band >= 0))
+            model = model[np.lexsort((photometry.realization[model],
+                                      photometry.band[model]))]
+            band_codes = photometry.band[model]
+            new_curve = np.ones(len(model), dtype=bool)
+            new_curve[1:] = ((np.diff(band_codes) != 0) |
+                             (np.diff(photometry.realization[model]) != 0))
+            starts = np.flatnonzero(new_curve)
+            ends = np.append(starts[1:], len(model))
+            vertices = np.column_stack((photometry.time[model],
+                                        photometry.magnitude[model]))
         
         for band in bands: 
-            # Plotting Simulated Sata
-            for i in range(1, num_realizations+1):
-                mag = []
-                time = []
-                for point in fake_data:
-                    if int(point[u'realization']) == i and point[u'band'] == band:
-                        mag.append(float(point[u'magnitude']))
-                        time.append(float(point[u'time']))
-                plt.plot(time, mag, '-', color=self.bandcolor(band))
+            in_band = photometry.band_mask(band)
+            if envelope:
+                curve = quantiles[quantiles['band'] == band]
+                ax.fill_between(curve['time'], curve['q05'], curve['q95'],
+                                color=self.bandcolor(band), alpha=0.2, lw=0)
+                ax.fill_between(curve['time'], curve['q16'], curve['q84'],
+                                color=self.bandcolor(band), alpha=0.4, lw=0)
+                ax.plot(curve['time'], curve['q50'], '-', 
+                        color=self.bandcolor(band))
+            else:
+                # Plotting Simulated Sata, every realization of the band at once
+                code = photometry.bands.index(band)
+                curves = [vertices[i:j] for i, j in zip(starts, ends)
+                          if band_codes[i] == code]
+                ax.add_collection(LineCollection(
+                    curves, colors=[self.bandcolor(band)], linestyles='-'))
                 
             # Plotting real data
-            mag = []
-            time = []
-            error = []
-            for point in real_data:
-                if point[u'band'] == band:
-                    mag.append(float(point[u'magnitude']))
-                    time.append(float(point[u'time']))
-                    error.append(float(point[u'e_magnitude']))
-                    
-            plt.errorbar(time, mag, fmt='o' ,yerr=error, 
-                         label=str(instruments[0]) + ' ' + str(band), 
-                         markerfacecolor=self.bandcolor(band), markeredgecolor='k', ecolor='k')
+            points = in_band & observed
+            ax.errorbar(photometry.time[points], photometry.magnitude[points],
+                        fmt='o', yerr=photometry.e_magnitude[points],
+                        label=str(instrument) + ' ' + str(band), 
+                        markerfacecolor=self.bandcolor(band), markeredgecolor='k', ecolor='k')
             
         true, q_50, q_m, q_p = analyze_single.get_plotting_vals()*180/np.pi
 
@@ -114,13 +144,15 @@ class Plotting(object):
         fmt = "{0:.2f}".format
         title = r"${{{0}}}_{{-{1}}}^{{+{2}}}$"
         title = title.format(fmt(q_50), fmt(q_m), fmt(q_p))
-        plt.title(r'$\theta_{true}$ = ' +  	"{:.0f}".format(true) + r', $\theta_{meas}$ = ' + title)
+        ax.set_title(r'$\theta_{true}$ = ' +  	"{:.0f}".format(true) + r', $\theta_{meas}$ = ' + title)
         
-        plt.legend()
+        ax.autoscale_view()
+        ax.legend()
         if save:
-            plt.savefig(name, dpi=300)
+            ax.figure.savefig(name, dpi=300)
         
 
+    @timing.timed('plotting.money_plot')
     def money_plot(self, analyze_set, name='money.png', theta=True, save=False, truevtrue=True):
         '''
         Given a set of analyze.py objects, makes the money plot, ie the parameters
@@ -162,6 +194,7 @@ class Plotting(object):
         return colors[band]
     
     
+    @timing.timed('plotting.single_raw')
     def single_raw(self, 
                    data_path='data.json', 
                    name='input.png', 
@@ -177,10 +210,7 @@ class Plotting(object):
         '''
 
         # Import data
-        with open(data_path, 'r') as f:
-            data = json.loads(f.read())
-            if 'name' not in data:
-                data = data[list(data.keys())[0]]
+        data = jsonio.read_event(data_path)
 
         sns.reset_orig()
         plt.rcParams["font.family"] = "serif"
@@ -224,6 +254,7 @@ class Plotting(object):
             plt.savefig(name, dpi=300)
             
             
+    @timing.timed('plotting.single_raw_comparison')
     def single_raw_comparison(self, data_paths=['data.json'], labels=[" "], name='input.png', save =False, band=u'g'):
         '''
         Plots the data from a single, already existing data set
@@ -268,10 +299,7 @@ class Plotting(object):
         for data_path, label, color in zip(data_paths, labels, colors):
 
             # Import data
-            with open(data_path, 'r') as f:
-                data = json.loads(f.read())
-                if 'name' not in data:
-                    data = data[list(data.keys())[0]]
+            data = jsonio.read_event(data_path)
 
 
             real_data = data['photometry']
@@ -304,4 +332,158 @@ class Plotting(object):
         if save:
             plt.savefig(name, dpi=300)
 
+    @timing.timed('plotting.render_set')
+    def render_set(self, analyze_set, directory='figures', 
+                   kinds=('corner', 'comparison'), workers=None, dpi=300,
+                   force=False):
+        '''
+        Renders the per simulation figures (kinds: 'corner', 'comparison') 
+        of every simulation of an analyze.Set to directory, as 
+        <simulation>_<kind>.png ('envelope' is the comparison with 
+        envelope=True), in a pool of workers processes (default: 
+        one per core).
+
+        A figure is skipped if it was rendered before from the same 
+        walkers.json (same size and modification time), true value and dpi,
+        unless force is set.
 
+        Returns {figure path: 'rendered', 'skipped' or the error}
+        '''
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for kind in kinds:
+            if kind not in FIGURES:
+                raise ValueError('Unknown figure ' + str(kind))
+
+        # the stamps are checked here, so that only the simulations with
+        # something to draw are sent to the pool (and, in a lazy Set,
+        # loaded), each once with all its figures
+        statuses = {}
+        jobs = []
+        for n, single in enumerate(analyze_set.get_simulations()):
+            label = analyze.simulation_label(single.data_path, n)
+            figures = []
+            for kind in kinds:
+                path = os.path.join(directory, label + '_' + kind + '.png')
+                stamp = _stamp(single, kind, dpi)
+                if not force and _up_to_date(path, stamp):
+                    statuses[path] = 'skipped'
+                else:
+                    figures.append((kind, path, stamp))
+            if figures:
+                jobs.append((single, figures, dpi))
+
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        if workers > 1 and len(jobs) > 1:
+            pool = multiprocessing.Pool(min(workers, len(jobs)))
+            try:
+                results = pool.map(_render, jobs, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [_render(job) for job in jobs]
+
+        for result in results:
+            statuses.update(result)
+        return statuses
+
+
+def _draw_corner(plotting, single, fig):
+    # corner (2.0) can't draw a single parameter on a figure it is given, so
+    # this one is a pyplot figure, closed by _render
+    return plotting.single_corner(single)
+
+
+def _draw_comparison(plotting, single, fig):
+    plotting.single_comparison(single, ax=fig.add_subplot(111))
+
+
+def _draw_envelope(plotting, single, fig):
+    plotting.single_comparison(single, ax=fig.add_subplot(111), envelope=True)
+
+
+# figure: (size, style, drawing function), for Plotting.render_set
+FIGURES = {
+    'corner': ((8, 10), {'font.family': 'serif', 'font.size': 12},
+               _draw_corner),
+    'comparison': ((12, 8), {'font.family': 'serif', 'font.size': 14},
+                   _draw_comparison),
+    'envelope': ((12, 8), {'font.family': 'serif', 'font.size': 14},
+                 _draw_envelope)}
+
+# bump when the figures change, so that render_set draws them again
+FIGURES_VERSION = 1
+
+
+def _stamp(single, kind, dpi):
+    '''
+    What a figure is drawn from: the walkers.json it was read from, what of
+    it the Single holds (its load options, or its contents when they aren't
+    known), the true value, the kind and dpi
+    '''
+    try:
+        stat = os.stat(jsonio.resolve(single.data_path))
+        identity = (os.path.abspath(single.data_path), stat.st_size, 
+                    repr(stat.st_mtime))
+    except OSError:
+        identity = None
+    held = getattr(single, 'load_options', None)
+    if held is None:
+        held = (single.get_param_names(), single.get_num_realizations(), 
+                len(single.get_photometry()))
+    else:
+        held = sorted(held.items())
+    text = repr((FIGURES_VERSION, identity, held, 
+                 repr(single.get_true_val()), kind, dpi))
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def _up_to_date(path, stamp):
+    '''
+    Whether the figure at path was drawn from what stamp describes
+    '''
+    if not os.path.isfile(path):
+        return False
+    try:
+        with open(path + '.stamp', 'r') as f:
+            return f.read().strip() == stamp
+    except IOError:
+        return False
+
+
+def _render(job):
+    '''
+    Draws the figures of one simulation for Plotting.render_set, each on its
+    own Figure, outside of pyplot, and writes them and their stamps. 
+    Returns [(path, status)].
+    '''
+    single, figures, dpi = job
+    results = []
+    for kind, path, stamp in figures:
+        size, style, draw = FIGURES[kind]
+        try:
+            with timing.span('plotting.render', path=path, kind=kind):
+                with matplotlib.rc_context(style):
+                    fig = Figure(figsize=size)
+                    FigureCanvasAgg(fig)
+                    drawn = fig
+                    try:
+                        drawn = draw(Plotting(), single, fig) or fig
+                        # write next to the figure first so a figure is 
+                        # never half written
+                        tmp = path + '.tmp.png'
+                        drawn.savefig(tmp, dpi=dpi)
+                        os.rename(tmp, path)
+                    finally:
+                        fig.clf()
+                        plt.close(drawn)
+        except Exception as e:
+            results.append((path, type(e).__name__ + ': ' + str(e)))
+            continue
+
+        with open(path + '.stamp', 'w') as f:
+            f.write(stamp + '\n')
+        results.append((path, 'rendered'))
+    return results
@@ -0,0 +1,135 @@
+# MOSFiT Simulation Tools
+# schedule.py
+# python2
+
+# MOSFiT  (https://github.com/SSantosLab/MOSFiT) REQUIRED
+# Built to work with the kasen_model model in MOSFIT (found in the SSantosLab
+# github)
+
+# Spreading the fits of a simulate.Set over a fixed number of workers (screen
+# sessions, or the threads of Set.run) so that they all finish at about the
+# same time. The cost of a fit is taken to grow with
+#     walkers x iterations x photometry points
+# (every iteration evaluates the model of every walker at every point), at a
+# rate in seconds per unit that is calibrated on the fits that already ran,
+# from the manifest or the timing events. A fit that already ran is expected
+# to take as long as it did. The fits are then packed longest first, each on
+# the worker that is free earliest (LPT), which is never more than a third
+# over the best possible makespan.
+
+
+import heapq
+
+import numpy as np
+
+import manifest as manifest_module
+
+# seconds per walker, iteration and photometry point, when there is nothing
+# to calibrate on. A rough figure for kasen_model on one core.
+DEFAULT_SECONDS_PER_UNIT = 1.5e-3
+
+
+def cost_units(walkers, iterations, points):
+    '''
+    The size of a fit, in walkers x iterations x photometry points
+    '''
+    return float(walkers)*float(iterations)*float(points)
+
+
+def history_from_manifest(manifest):
+    '''
+    {run dir: wall time} of the fits a manifest.Manifest saw finish
+    '''
+    history = {}
+    for state in manifest.entries().values():
+        if (state.get('phase') == manifest_module.DONE and
+                state.get('wall_time') and state.get('run_dir')):
+            history[state['run_dir']] = state['wall_time']
+    return history
+
+
+def history_from_events(events):
+    '''
+    {run dir: wall time} of the successful fits in a list of timing events.
+    The chunks of an adaptive fit add up.
+    '''
+    history = {}
+    failed = set()
+    for event in events:
+        if event.get('event') != 'simulate.fit' or 'path' not in event:
+            continue
+        if event.get('returncode', 0) != 0 or 'error' in event:
+            failed.add(event['path'])
+        history[event['path']] = history.get(event['path'], 0.) + \
+            event['wall']
+    for path in failed:
+        history.pop(path, None)
+    return history
+
+
+def estimate(units, keys=None, history=None):
+    '''
+    The predicted seconds of every fit. units: cost_units() of each fit,
+    keys: what history is keyed by (run dirs) for each fit, history:
+    {key: seconds} of fits that already ran.
+
+    Fits in history are predicted to take what they took, the others units
+    times the median seconds per unit of the fits in history (or
+    DEFAULT_SECONDS_PER_UNIT).
+    '''
+    units = np.asarray(units, dtype=float)
+    history = history or {}
+    known = np.array([keys is not None and keys[i] in history
+                      for i in range(len(units))], dtype=bool)
+    rates = [history[keys[i]]/units[i] for i in np.flatnonzero(known)
+             if units[i] > 0]
+    rate = float(np.median(rates)) if rates else DEFAULT_SECONDS_PER_UNIT
+
+    seconds = units*rate
+    for i in np.flatnonzero(known):
+        seconds[i] = history[keys[i]]
+    return seconds
+
+
+def pack(costs, workers):
+    '''
+    Longest processing time first: the jobs (by cost) are taken from the
+    most to the least costly and each goes to the worker with the least
+    work so far.
+
+    Returns (the job indices of every worker in the order they run, the
+    total cost of every worker). Workers may be left empty when there are
+    fewer jobs than workers.
+    '''
+    workers = max(1, int(workers))
+    bins = [[] for _ in range(workers)]
+    heap = [(0., w) for w in range(workers)]
+    # stable, so equal costs keep their order
+    order = sorted(range(len(costs)), key=lambda i: -costs[i])
+    for i in order:
+        load, w = heapq.heappop(heap)
+        bins[w].append(i)
+        heapq.heappush(heap, (load + costs[i], w))
+    loads = [0.]*workers
+    for load, w in heap:
+        loads[w] = load
+    return bins, loads
+
+
+def report(costs, loads):
+    '''
+    The predicted makespan (hours until the last worker is done), CPU hours
+    and how much of the workers' time goes to waiting for the last one
+    '''
+    makespan = max(loads) if len(loads) else 0.
+    total = float(np.sum(costs))
+    return {'makespan_hours': makespan/3600., 'cpu_hours': total/3600.,
+            'workers': len(loads), 'idle_fraction':
+            1. - total/(makespan*len(loads)) if makespan > 0 else 0.}
+
+
+def print_report(summary):
+    print("Predicted makespan {0:.2f} h on {1} workers, {2:.2f} CPU hours "
+          "({3:.0%} idle)".format(summary['makespan_hours'],
+                                  summary['workers'], summary['cpu_hours'],
+                                  summary['idle_fraction']))
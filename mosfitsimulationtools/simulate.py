@@ -9,11 +9,443 @@
 # github)
 
 
+import functools
+import hashlib
+import itertools
 import subprocess
 import json
+import multiprocessing
 import os
+import shutil
+import sys
+import time
+from multiprocessing.pool import ThreadPool
 import numpy as np
 
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote
+
+import jsonio
+import manifest as manifest_module
+import schedule
+import stream
+import sweep as sweep_module
+import timing
+
+# environment variables that set the thread count of the numerical libraries
+THREAD_ENV_VARS = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                   'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS']
+
+
+def thread_limited_env(threads):
+    '''
+    A copy of the environment with BLAS/OpenMP limited to threads threads
+    '''
+    env = dict(os.environ)
+    for var in THREAD_ENV_VARS:
+        env[var] = str(threads)
+    return env
+
+
+def _run_fit(job):
+    '''
+    Runs one fitting command for Set.run(), logging its output and recording
+    it in the manifest
+    '''
+    sim_id, name, run_loc, command, log_path, env, manifest = job
+    print("Running " + name + ": " + command)
+    manifest.record(sim_id, manifest_module.FITTING, log=log_path)
+    start = time.time()
+    with open(log_path, 'w') as log, timing.span(
+            'simulate.fit', name=name, path=run_loc) as fields:
+        try:
+            returncode = timing.call(command, fields, shell=True, cwd=run_loc,
+                                     stdout=log, stderr=subprocess.STDOUT,
+                                     env=env)
+        except OSError as e:
+            log.write(str(e) + '\n')
+            returncode = fields['returncode'] = -1
+    wall_time = time.time() - start
+    print("Finished " + name + " with exit code " + str(returncode) + 
+          " in {:.1f} s".format(wall_time))
+
+    product = os.path.join(run_loc, 'products', 'walkers.json')
+    if returncode == 0 and manifest_module.valid_walkers(product):
+        manifest.record(sim_id, manifest_module.DONE, product=product,
+                        wall_time=wall_time)
+    else:
+        manifest.record(sim_id, manifest_module.FAILED, stage='fit',
+                        returncode=returncode, wall_time=wall_time)
+
+    return {'name': name, 'run_dir': run_loc, 'log': log_path, 
+            'returncode': returncode, 'wall_time': wall_time, 
+            'skipped': False}
+
+
+# where an adaptive fit keeps the walkers of its last chunk, in the run dir, 
+# for the next chunk to start from
+PREVIOUS_WALKERS = 'walkers_previous.json'
+
+
+def read_psrf(path):
+    '''
+    The last PSRF (potential scale reduction factor) MOSFiT recorded under
+    models[0].convergence of a walkers.json, None if there is none
+    '''
+    try:
+        convergence = stream.read_walkers(path, params=[], 
+                                          fields=[])['convergence']
+    except (ValueError, KeyError, StopIteration, IOError):
+        return None
+    if not isinstance(convergence, list):
+        convergence = [convergence]
+    psrf = None
+    for entry in convergence:
+        if isinstance(entry, dict):
+            if entry.get('kind', 'psrf') != 'psrf':
+                continue
+            entry = entry.get('value')
+        try:
+            psrf = float(entry)
+        except (TypeError, ValueError):
+            continue
+    return psrf
+
+
+def _run_adaptive_fit(job):
+    '''
+    Runs one fit for Set.run() in chunks of iterations, every chunk starting
+    from the walkers of the one before, until the PSRF of the chains is at
+    most the target or the iteration or wall time budget is spent. A fit 
+    that was cut off with chunks done (see resume()) goes on from its last 
+    chunk.
+    '''
+    (sim_id, name, run_loc, commands, log_path, env, manifest, 
+     adaptive) = job
+    first_command, next_command = commands
+    target = adaptive['target_psrf']
+    chunk = adaptive['chunk_iterations']
+    product = os.path.join(run_loc, 'products', 'walkers.json')
+    previous = os.path.join(run_loc, PREVIOUS_WALKERS)
+
+    state = manifest.get(sim_id) or {}
+    iterations = chunks = 0
+    if state.get('iterations') and manifest_module.valid_walkers(product):
+        iterations, chunks = state['iterations'], state.get('chunks', 0)
+        print("Continuing " + name + " after " + str(iterations) + 
+              " iterations")
+    psrf = read_psrf(product) if iterations else None
+
+    start = time.time()
+    returncode = 0
+    last_chunk_time = 0.
+    while psrf is None or psrf > target:
+        elapsed = time.time() - start
+        if iterations and iterations + chunk > adaptive['max_iterations']:
+            break
+        if adaptive['max_wall_time'] is not None and (
+                elapsed + last_chunk_time > adaptive['max_wall_time']):
+            break
+
+        if iterations:
+            shutil.copyfile(product, previous)
+            command = next_command
+        else:
+            command = first_command
+        print("Running " + name + " (iterations " + str(iterations) + "-" +
+              str(iterations + chunk) + "): " + command)
+        manifest.record(sim_id, manifest_module.FITTING, log=log_path, 
+                        iterations=iterations, chunks=chunks)
+        chunk_start = time.time()
+        with open(log_path, 'a' if chunks else 'w') as log, timing.span(
+                'simulate.fit', name=name, path=run_loc, chunk=chunks,
+                iterations=chunk) as fields:
+            try:
+                returncode = timing.call(command, fields, shell=True, 
+                                         cwd=run_loc, stdout=log, 
+                                         stderr=subprocess.STDOUT, env=env)
+            except OSError as e:
+                log.write(str(e) + '\n')
+                returncode = fields['returncode'] = -1
+            if returncode == 0:
+                psrf = fields['psrf'] = read_psrf(product)
+        last_chunk_time = time.time() - chunk_start
+        if returncode != 0:
+            break
+        iterations += chunk
+        chunks += 1
+        print(name + " PSRF after " + str(iterations) + " iterations: " + 
+              str(psrf))
+
+    wall_time = time.time() - start
+    converged = psrf is not None and psrf <= target
+    print("Finished " + name + " with exit code " + str(returncode) + 
+          " after " + str(iterations) + " iterations" + 
+          (" (converged)" if converged else "") + 
+          " in {:.1f} s".format(wall_time))
+    if os.path.isfile(previous):
+        os.remove(previous)
+
+    if returncode == 0 and manifest_module.valid_walkers(product):
+        manifest.record(sim_id, manifest_module.DONE, product=product,
+                        wall_time=wall_time, iterations=iterations, 
+                        chunks=chunks, psrf=psrf, converged=converged)
+    else:
+        manifest.record(sim_id, manifest_module.FAILED, stage='fit',
+                        returncode=returncode, wall_time=wall_time,
+                        iterations=iterations, chunks=chunks)
+
+    return {'name': name, 'run_dir': run_loc, 'log': log_path, 
+            'returncode': returncode, 'wall_time': wall_time, 
+            'skipped': False, 'iterations': iterations, 'psrf': psrf, 
+            'converged': converged}
+
+
+def _guarded_fit(fit, job):
+    '''
+    Runs fit(job) for Set.run(). Whatever goes wrong is recorded as a failed
+    fit of that simulation, so that it doesn't stop the other fits.
+    '''
+    sim_id, name, run_loc, command, log_path, env, manifest = job[:7]
+    start = time.time()
+    try:
+        return fit(job)
+    except Exception as e:
+        error = type(e).__name__ + ': ' + str(e)
+        wall_time = time.time() - start
+        print("Fitting " + name + " failed: " + error)
+        try:
+            manifest.record(sim_id, manifest_module.FAILED, stage='fit',
+                            returncode=-1, wall_time=wall_time, error=error)
+        except (IOError, OSError):
+            pass
+        return {'name': name, 'run_dir': run_loc, 'log': log_path, 
+                'returncode': -1, 'wall_time': wall_time, 'skipped': False,
+                'error': error}
+
+
+def _generate_mock(job):
+    '''
+    Generates one mock and writes its input file, for 
+    Set.generate_input_data()
+    '''
+    mock, directory, error, store, pool, manifest = job
+    input_key = mock.get_input_key(error)
+
+    # already done before a crash
+    state = manifest.get(mock.sim_id) or {}
+    if state.get('input_file') and os.path.isfile(state['input_file']):
+        mock.path = os.path.join(os.path.abspath(directory), mock.name)
+        if state.get('input_key') == input_key:
+            print('Already generated... ' + mock.name)
+            mock.dump_path = state['input_file']
+            mock.generate_times()
+            return mock, state['input_file'], state['run_dir']
+        # made with other settings (e.g. mag_err): the fit of the old input
+        # file is kept aside, so that resume() fits the new one
+        fit = os.path.join(state['run_dir'], 'products', 'walkers.json')
+        if os.path.isfile(fit):
+            os.rename(fit, os.path.join(state['run_dir'], 'products', 
+                                        STALE_WALKERS))
+
+    params = dict((str(k), float(v)) for k, v in mock.point.items())
+    product = os.path.join(os.path.abspath(directory), mock.name, 
+                           'products', 'walkers.json')
+    try:
+        if state.get('product') == product and \
+                manifest_module.valid_walkers(product):
+            print('Writing the input file again... ' + mock.name)
+            mock.path = os.path.dirname(os.path.dirname(product))
+            mock.generate_times()
+        else:
+            print('Now generating... ' + mock.name)
+            call = mock.generate(directory, store=store, pool=pool)
+            if call != 0:
+                raise RuntimeError('MOSFiT exited with code ' + str(call))
+            manifest.record(mock.sim_id, manifest_module.GENERATED, 
+                            name=mock.name, params=params, product=product)
+        input_file_loc, run_dir = mock.generate_input_file(error=error)
+    except Exception as e:
+        manifest.record(mock.sim_id, manifest_module.FAILED, stage='generate',
+                        name=mock.name, params=params, input_file=None,
+                        error=type(e).__name__ + ': ' + str(e))
+        raise
+    manifest.record(mock.sim_id, manifest_module.INPUT_WRITTEN,
+                    input_file=input_file_loc, run_dir=run_dir, 
+                    input_key=input_key)
+    return mock, input_file_loc, run_dir
+
+
+# where the fit of an input file that was written again is kept, in the
+# products of the run dir
+STALE_WALKERS = 'walkers_stale.json'
+
+
+# how close (in days) a time in the MOSFiT output has to be to an 
+# observation time to count as that observation
+TIME_TOLERANCE = 1e-6
+
+
+def _windows(codes, times, band_times, tolerance):
+    '''
+    The rows sorted by (band, time), and for every observation time (all the
+    bands one after another) the [start, stop) of the sorted rows within
+    tolerance of it
+    '''
+    cadence_codes = np.concatenate([np.full(len(t), n, dtype=int)
+                                    for n, t in enumerate(band_times)])
+    cadence_times = np.concatenate([np.asarray(t, dtype=float)
+                                    for t in band_times])
+
+    # (band, time) as a single sortable key, bands far enough apart that
+    # their windows never overlap
+    low = min(times.min(), cadence_times.min())
+    high = max(times.max(), cadence_times.max())
+    spacing = high - low + 10*tolerance + 1.
+    keys = codes*spacing + (times - low)
+    order = np.lexsort((times, codes))
+    sorted_keys = keys[order]
+    targets = cadence_codes*spacing + (cadence_times - low)
+
+    starts = np.searchsorted(sorted_keys, targets - tolerance, side='left')
+    stops = np.searchsorted(sorted_keys, targets + tolerance, side='right')
+    return order, starts, stops
+
+
+def select_observations(codes, times, band_times, tolerance=TIME_TOLERANCE):
+    '''
+    Indices (ascending) of the photometry rows that are observations: rows 
+    whose time is within tolerance of one of the times of their band.
+
+    codes: band of each row, as an index into band_times (-1 for none)
+    times: time of each row
+    band_times: the observation times of each band
+
+    The rows are sorted by (band, time) once, then the window of rows around 
+    every observation time is found with searchsorted, so this is 
+    O((N + T) log N) however many rows and times there are.
+    '''
+    codes = np.asarray(codes)
+    times = np.asarray(times, dtype=float)
+    keep = np.zeros(len(times), dtype=bool)
+    if len(times) == 0 or len(band_times) == 0:
+        return np.flatnonzero(keep)
+
+    order, starts, stops = _windows(codes, times, band_times, tolerance)
+
+    # mark every row inside any window
+    inside = np.zeros(len(times) + 1, dtype=int)
+    np.add.at(inside, starts, 1)
+    np.add.at(inside, stops, -1)
+    keep[order[np.cumsum(inside)[:-1] > 0]] = True
+    keep &= codes >= 0
+    return np.flatnonzero(keep)
+
+
+def missing_observations(codes, times, band_times, tolerance=TIME_TOLERANCE):
+    '''
+    How many of the observation times have no row within tolerance of them
+    (arguments as for select_observations)
+    '''
+    total = sum(len(t) for t in band_times)
+    codes = np.asarray(codes)
+    times = np.asarray(times, dtype=float)
+    if len(times) == 0 or total == 0:
+        return total
+    order, starts, stops = _windows(codes, times, band_times, tolerance)
+    return int(np.sum(stops <= starts))
+
+
+def legacy_times(band_times):
+    '''
+    band_times as the versions before exact times gave them to MOSFiT: 
+    truncated to 5 characters ('|S5' strings), so 0.6699999999999999 was 
+    0.669. Their products hold these times.
+    '''
+    return [np.asarray(t, dtype=float).astype('|S5').astype(float)
+            for t in band_times]
+
+
+class Cadence(object):
+    '''
+    The times at which a simulation is observed, in every band.
+
+    By default each of num_nights nights starts at (1 - night_length) days 
+    plus one day per night, with N_obs observations spread over the 
+    night_length, and every band is observed band_offset days after the one 
+    before it. A 0 is added at the start of every night, as MOSFiT needs the 
+    light curve from the explosion on.
+
+    night_gaps: days between the starts of consecutive nights (num_nights-1 
+    values), 1 day each by default
+    schedules: {band: times} for bands with their own schedule, these times 
+    are used as they are
+    '''
+    def __init__(self, bands, num_nights=3, night_length=0.33, N_obs=4,
+                 band_offset=0.01, night_gaps=None, schedules=None):
+        self.bands = list(bands)
+        self.num_nights = num_nights
+        self.night_length = night_length
+        self.N_obs = N_obs
+        self.band_offset = band_offset
+        if night_gaps is None:
+            night_gaps = [1.]*(num_nights - 1)
+        if len(night_gaps) != num_nights - 1:
+            raise ValueError('Need ' + str(num_nights - 1) + ' night gaps')
+        self.night_gaps = list(night_gaps)
+        self.schedules = dict(schedules or {})
+
+    def grid(self):
+        '''
+        The (bands x num_nights*(N_obs+1)) times of the regular schedule, 
+        computed in one go. Sums are done in the same order as the loops
+        this replaced, so the times are identical to the last bit.
+        '''
+        day_length = 1. - self.night_length
+        # cumsum adds one day at a time, like start += 1 did
+        night_starts = np.cumsum([day_length] + self.night_gaps)
+        offsets = np.cumsum([0.] + [self.band_offset]*(len(self.bands) - 1))
+        starts = night_starts[None, :] + offsets[:, None]
+        stops = (night_starts + self.night_length)[None, :] + offsets[:, None]
+        observations = np.linspace(starts, stops, num=self.N_obs, axis=-1)
+        zeros = np.zeros(observations.shape[:2] + (1,))
+        times = np.concatenate((zeros, observations), axis=-1)
+        return times.reshape(len(self.bands), -1)
+
+    def times(self):
+        '''
+        A list with the array of times of each band, in band order
+        '''
+        grid = self.grid()
+        return [np.asarray(self.schedules[band], dtype=float)
+                if band in self.schedules else grid[i]
+                for i, band in enumerate(self.bands)]
+
+    def flat(self):
+        '''
+        The times of all the bands one after another
+        '''
+        return np.concatenate(self.times())
+
+
+# the file in a Set directory that records the progress of every simulation
+MANIFEST_FILE = 'manifest.jsonl'
+
+# Commands longer than this can't be passed to a shell (Linux caps a single
+# argument, here the whole 'sh -c' command line, at 128 kB)
+MAX_COMMAND_LENGTH = 100000
+
+# Runs MOSFiT with its arguments read from a file, for argument lists too
+# long for the command line, with the python of this process
+MOSFIT_FROM_FILE = quote(sys.executable) + ' -c ' + quote(
+    "import json, sys; from mosfit.main import main; "
+    'sys.argv = ["mosfit"] + json.load(open(sys.argv[1])); main()') + ' '
+
+MOSFIT_ARGS_FILE = 'mosfit_args.json'
+
+
 class Single(object):
     """
     Represents a single data set made with MOSFiT in generative mode. 
@@ -35,10 +467,14 @@ class Single(object):
                  param_vals = [('Msph1', 0.04), ('vk1', 0.1), ('xlan1', 1e-2 ),
                                ('theta', 0.0), ('phi', 0.7), ('Msph0', 0.025),
                                ('vk0', 0.3), ('xlan0',1e-4)],
-                 generate_extras = False, extras = ['times']):
+                 generate_extras = False, extras = ['times'],
+                 night_gaps = None, schedules = None):
         ''' 
         Specify the terms of the simulation, built in defaults are for the
         kasen_model
+
+        night_gaps, schedules: for observations off the regular schedule, 
+        see Cadence
         '''
     
         self.name = name
@@ -54,28 +490,106 @@ class Single(object):
         self.telescope = telescope
         self.generate_extras = generate_extras
         self.extras = extras
+        self.cadence = Cadence(bands, num_nights=num_nights,
+                               night_length=night_length, N_obs=N_obs,
+                               band_offset=band_offset, night_gaps=night_gaps,
+                               schedules=schedules)
+
+    def get_id(self):
+        '''
+        A stable ID of the simulation, a hash of everything that goes into
+        generating it (but not its name)
+        '''
+        config = [self.model,
+                  sorted((str(k), repr(float(v))) for k, v in self.param_vals),
+                  [str(b) for b in self.bands], self.instrument,
+                  self.telescope,
+                  [[repr(float(t)) for t in band] for band in self.cadence.times()],
+                  self.S, list(self.extras) if self.generate_extras else []]
+        return hashlib.sha1(json.dumps(config).encode('utf-8')).hexdigest()[:12]
+
+    def get_generation_key(self):
+        '''
+        A hash of everything MOSFiT is given to generate this simulation:
+        the model, parameters, bands, instrument, exact times, S and extras
+        '''
+        config = {'model': self.model,
+                  'params': sorted((str(k), repr(float(v)))
+                                   for k, v in self.param_vals),
+                  'bands': [str(b) for b in self.bands],
+                  'instrument': self.instrument,
+                  'times': self.generate_times(),
+                  'S': str(self.S),
+                  'extras': list(self.extras) if self.generate_extras else []}
+        return hashlib.sha1(json.dumps(config, sort_keys=True).encode('utf-8')
+                            ).hexdigest()
+
+    def get_input_key(self, error):
+        '''
+        A hash of everything the input file of generate_input_file(error) 
+        depends on: what MOSFiT generated, the name, telescope and error
+        '''
+        config = [self.get_generation_key(), self.name, self.telescope,
+                  repr(float(error))]
+        return hashlib.sha1(json.dumps(config).encode('utf-8')).hexdigest()
 
-    def generate(self):
+    def generate(self, directory=None, store=None, pool=None):
         '''
         Creates a MOSFiT command, creates the directory from which MOSFiT will
         be called, calls MOSFiT.
+
+        directory: where the directory of this simulation goes, the current
+        directory by default. MOSFiT is started in the simulation directory
+        without changing the working directory of this process, so several
+        Singles can generate at the same time.
+        store: a cache.GenerationStore. If it has this configuration, its 
+        walkers.json is linked in and MOSFiT isn't called at all, otherwise 
+        the new output is added to it.
+        pool: a worker.WorkerPool to generate on instead of starting a new 
+        MOSFiT process
         
         Returns the suprocess call code
         '''
         
         command = self.create_mosfit_gen_command()
-        old_path = os.getcwd()
+        if directory is None:
+            directory = os.getcwd()
         
-        self.path = old_path + '/' + self.name
+        self.path = os.path.join(os.path.abspath(directory), self.name)
         try:
             os.mkdir(self.path)
         except OSError:
             print("Making directory " + self.name + " failed.")
             
-        os.chdir(self.path)
-        print("Calling the command: " + str(command))
-        call = subprocess.call(command, shell =True)
-        os.chdir(old_path)
+        product = os.path.join(self.path, 'products', 'walkers.json')
+        with timing.span('simulate.generate', name=self.name, 
+                         path=self.path) as fields:
+            if store is not None:
+                key = self.get_generation_key()
+                if store.fetch(key, product):
+                    print("Reusing the generated data of " + key + " for " + 
+                          self.name)
+                    fields.update(backend='store', returncode=0)
+                    return 0
+
+            if pool is not None:
+                print("Generating " + self.name + " on a MOSFiT worker")
+                fields['backend'] = 'pool'
+                call = fields['returncode'] = pool.call(self.gen_args, 
+                                                        self.path)
+            else:
+                if self.mosfit_args is not None:
+                    with open(os.path.join(self.path, MOSFIT_ARGS_FILE), 
+                              'w') as f:
+                        json.dump(self.mosfit_args, f)
+
+                print("Calling the command: " + str(command))
+                fields['backend'] = 'subprocess'
+                call = timing.call(command, fields, shell =True, 
+                                   cwd=self.path)
+
+            if store is not None and call == 0 and os.path.isfile(product):
+                store.add(key, product)
         
         return call
     
@@ -84,109 +598,115 @@ class Single(object):
         A helper for create_mosfit_gen_command() that creates the necessary times
         to generate the observations. 
         '''
-        day_length = 1. - self.night_length
-        current_offset = 0
-        times = np.empty((0,self.num_nights*(self.N_obs+1)))
-
-
-        for band in self.bands:
-            band_times = np.array([[]])
-            start = day_length
-            for night in range(0, self.num_nights):
-        	single_times = np.concatenate((np.array([0.]),
-                np.linspace([start + current_offset],
-                                [start + self.night_length + current_offset],
-                                num = self.N_obs ))) 
-                band_times = np.append(band_times, single_times)
-
-                start += 1
-            band_times = band_times.reshape(1, len(band_times))
-            times = np.append(times, band_times, axis=0)
-            current_offset += self.band_offset
-
-        self.times = times
-        self.times_strings = times.astype('|S5')
+        self.band_times = self.cadence.times()
+        lengths = set(len(i) for i in self.band_times)
+        if len(lengths) == 1:
+            self.times = np.array(self.band_times)
+        else:
+            self.times = self.band_times
         
-        # we're gonna need this one later too
-        # we're going to need the flat version on return
-	return self.times_strings.flatten()
+        # repr keeps every digit, so MOSFiT gets exactly these times
+        return [repr(float(t)) for t in np.concatenate(self.band_times)]
 
         
     def create_mosfit_gen_command(self):
         '''
         A helper for generate() that generates the command that calls MOSFiT in
         generative mode
+
+        If there are too many times for a command line, the arguments go in 
+        self.mosfit_args, which generate() writes to MOSFIT_ARGS_FILE, and the
+        command reads them from there.
         '''
         param_list = []
         for i in self.param_vals:
             param_list.append(str(i[0]))
             param_list.append(str(i[1]))
             
-        param_str = " ".join(param_list)
-        
-        times_flat = self.generate_times()
-        times_str = " ".join(times_flat)
-        
-        command = ('mosfit -m ' + self.model + ' --band-instruments ' + 
-                   self.instrument + " --band-list " + " ".join(self.bands) +
-                   ' --extra-times ' + times_str + " -F " + param_str + 
-                    ' -S ' + str(self.S) + " " + 
-                   '--no-copy-at-launch -N 1 ' ) 
+        args = (['-m', self.model, '--band-instruments', self.instrument,
+                 '--band-list'] + list(self.bands) +
+                ['--extra-times'] + self.generate_times() +
+                ['-F'] + param_list +
+                ['-S', str(self.S), '--no-copy-at-launch', '-N', '1'])
         
         if self.generate_extras:
-            extra_str = " -x " + " ".join(self.extras)
-            command = command + extra_str
+            args += ['-x'] + list(self.extras)
+        self.gen_args = args
 
+        command = 'mosfit ' + ' '.join(args)
+        self.mosfit_args = None
+        if len(command) > MAX_COMMAND_LENGTH:
+            self.mosfit_args = args
+            command = MOSFIT_FROM_FILE + MOSFIT_ARGS_FILE
         
         return command
     
     
+    @timing.timed('simulate.generate_input_file', 
+                  lambda self, *args, **kwargs: {'name': self.name, 
+                                                 'path': self.path})
     def generate_input_file(self, error = 0.02):
         '''
         Generates an input file for the evaluative run of MOSFiT
         '''
         self.sampleerr = error
         
-        with open('./' + self.name +'/products/walkers.json', 'r') as f:
-            data = json.loads(f.read())
-            if 'name' not in data:
-                data = data[list(data.keys())[0]]
+        data = jsonio.read_event(os.path.join(self.path, 'products', 
+                                              'walkers.json'))
         
         photo = data['photometry']
         
-	# Remove dict entries we don't need
-        for i in photo:
-            del i[u'model']
-            del i[u'realization']
-            del i[u'source']
+        # Bands but unicode
+        bands_unicode = [unicode(s) for s in self.bands]
+        band_codes = dict((band, n) for n, band in enumerate(bands_unicode))
+        codes = np.array([band_codes.get(i[u'band'], -1) for i in photo],
+                         dtype=int)
+        times = np.array([float(i[u'time']) for i in photo])
+         
+        # Keep only the right bands and times, grouped by band
+        band_times = self.cadence.times()
+        missing = missing_observations(codes, times, band_times)
+        if missing:
+            # generated before the times were passed to MOSFiT exactly?
+            legacy = legacy_times(band_times)
+            if missing_observations(codes, times, legacy) < missing:
+                band_times = legacy
+                missing = missing_observations(codes, times, legacy)
+        if missing:
+            print("Warning: " + str(missing) + " observation times of " + 
+                  self.name + " are not in its MOSFiT output, they are left "
+                  "out of the input file.")
+        keep = select_observations(codes, times, band_times)
+        keep = keep[np.argsort(codes[keep], kind='mergesort')]
+
+        # set the 0 point to be basically the point it always is on the Kasen 
+        # SEDs (cheating but whatver). This has only ever been applied to the
+        # last entry of each band.
+        valid = np.flatnonzero(codes >= 0)
+        last = np.full(len(bands_unicode), -1, dtype=int)
+        np.maximum.at(last, codes[valid], valid)
+        zero_points = set(i for i in last if i >= 0 and times[i] == 0.0)
+
+        photo_reduced_2 = []
+        for n in keep:
+            i = photo[n]
+            # Remove dict entries we don't need
+            i.pop(u'model', None)
+            i.pop(u'realization', None)
             i[u'e_magnitude'] = error
             i[u'source'] = '1'
             i[u'telescope'] = self.telescope
             i[u'system'] = 'AB'
-        
-        # Bands but unicode
-        bands_unicode = [unicode(s) for s in self.bands]
-         
-        # Keep only the right bands
-        photo_reduced = []
-        for band, times_allowed in zip(bands_unicode, self.times_strings):
-            p = [i for i in photo if i[u'band'] == band]
-            allowed_p = []
-            for entry in p:
-                if str(entry[u'time']) in times_allowed:
-                    allowed_p.append(entry)
-            if float(entry[u'time']) == 0.0:
-                entry[u'magnitude'] = "24.0" # set the 0 point to be basically the point it always is on the Kasen SEDs (cheating but whatver)
-            photo_reduced.append(allowed_p)
-        photo_reduced_2 = [obs for band_sublist in photo_reduced for obs in band_sublist]
+            if n in zero_points:
+                i[u'magnitude'] = "24.0"
+            photo_reduced_2.append(i)
     
         self.mock_sample = {self.name: {'name': self.name,"sources":[{"name":"MOSFiT generated data", "alias":"1"}],
                     "alias":[{"value":"MOSFiT generated data","source":"1"}], 'photometry': photo_reduced_2}}
 
         self.dump_path = self.path + '/' + self.name + '.json'
 
-        with open( self.dump_path, 'w') as outfile:
-            json.dump(self.mock_sample, outfile, indent=4)
+        jsonio.dump(self.mock_sample, self.dump_path)
 
         # we want to make a directory here where MOSFiT will eventually be run
         # Because if you're making an input file... then you're also going
@@ -232,12 +752,40 @@ class Set(object):
                        ('vk0', 0.3), ('xlan0',1e-4)],
         free_params = [('theta', np.linspace(0,1.57,10))],
         dump_extras_on_gen = False,
-        extras = ['lum_0', 'lum_1', 'times']):
+        extras = ['lum_0', 'lum_1', 'times'],
+        workers = 1,
+        sweep = None,
+        shard = None,
+        night_gaps = None,
+        schedules = None,
+        store = None,
+        pool = None):
         '''
         Creates a set of Single objects, whcih are the mock observations,
         with parameters specified by initialization. 
 
         These parameters ONLY deermine the mock data attributes.
+
+        workers: how many mocks MOSFiT generates at the same time
+        sweep: a sweep.Sweep (Grid, LatinHypercube, Sobol, RandomDraws...) 
+        of the parameter values to simulate, used instead of free_params. 
+        Values in a point replace those in fixed_params. The mocks are 
+        named after their IDs.
+        shard: (index, count), generate only that shard of the sweep
+        night_gaps, schedules: for observations off the regular schedule, 
+        see Cadence
+        store: a cache.GenerationStore to take already generated mocks from
+        pool: a worker.WorkerPool of MOSFiT processes to generate on, by 
+        default every mock starts its own MOSFiT. Give it at least workers
+        workers.
+
+        The progress of every mock is recorded in the manifest (see 
+        manifest.py), mocks whose input file was written before are not 
+        generated again.
+
+        Every mock is recorded in the sim_paths file (one JSON line per mock 
+        with its ID, name, parameters and run dir). If only one parameter is 
+        varied, run_paths is written for analyze.Set as well.
         '''    
         self.model = model
         self.band_offset = band_offset
@@ -254,66 +802,144 @@ class Set(object):
 
         self.dump_extras = dump_extras_on_gen
         self.extras = extras
+        self.night_gaps = night_gaps
+        self.schedules = schedules
 
         self.run_locs = {} # location of run dir for each simulation
+        self.sims = [] # ID, name, parameters and run dir of each simulation
         self.mocks = [] # the set of Single() objects
         self.input_files = [] # the location of the input files 
         self.run_dirs = [] # the directories that simulations will be run in
 
         self.old_path = os.getcwd()
-        self.path = self.old_path + '/' + self.name
+        self.path = os.path.join(self.old_path, self.name)
         try:
             os.mkdir(self.path)
         except OSError:
             print("Making directory " + self.name + " failed.")
-        os.chdir(self.path)
-
-        for free in self.free_params: # for each free parameter
-        # Only allowed to vary one parameter at a time! 
-            free_param_name = free[0]
-            for val in free[1]: # for each value available
-                if free_param_name == 'theta' or free_param_name == 'phi':
-                    sim_name = free_param_name + '{:.0f}'.format(val*180/np.pi)
-                else:
-                    sim_name = free_param_name + str(val)
-                print('Now generating... ' + sim_name)                
-                mock = Single(sim_name, 
-                              num_nights = self.num_nights,
-                              night_length = self.night_length,
-                              band_offset = self.band_offset,
-                              N_obs = self.N_obs,
-                              param_vals = self.fixed_params + 
-                              [(free_param_name, val)], 
-                    model = self.model,
-                    instrument = self.instrument,
-                    telescope = self.telescope,
-                    bands = self.bands,
-                    S = self.S,
-                    generate_extras = self.dump_extras, extras = self.extras)
-                mock.generate()                
-                self.mocks.append(mock)
-                
-                input_file_loc, run_dir = mock.generate_input_file(error=self.mag_err)
-                self.input_files.append(input_file_loc)
-                self.run_dirs.append(run_dir)
-                
-                self.run_locs[val] = run_dir
 
-        # create the run locs file
-        f = open("run_paths", 'w')
-        for i in self.run_locs:
-            f.write(str(i) + ' ' + self.run_locs[i] + '\n')
+        # free_params keep the old names and {value: run dir} run_locs
+        self.legacy_names = sweep is None
+        if sweep is None:
+            # Only allowed to vary one parameter at a time! 
+            points = sweep_module.one_at_a_time(self.free_params)
+            mocks = (self.create_mock(point, self._legacy_name(point))
+                     for point in points)
+        else:
+            mocks = self.plan(sweep, shard)
+
+        suffix = ''
+        if shard is not None:
+            suffix = '_' + str(shard[0]) + 'of' + str(shard[1])
+        self.manifest = manifest_module.Manifest(
+            os.path.join(self.path, MANIFEST_FILE + suffix))
+
+        jobs = ((mock, self.path, self.mag_err, store, pool, self.manifest) 
+                for mock in mocks)
+        if workers > 1:
+            # MOSFiT runs in subprocesses, threads are enough to wait on them
+            threads = ThreadPool(workers)
+            try:
+                # a few mocks per worker at a time: the pool would take the 
+                # whole plan at once, making every Single of the sweep 
+                # before the first is generated
+                while True:
+                    batch = list(itertools.islice(jobs, 4*workers))
+                    if not batch:
+                        break
+                    for output in threads.imap(_generate_mock, batch, 
+                                               chunksize=1):
+                        self._add_mock(*output)
+            finally:
+                threads.close()
+                threads.join()
+        else:
+            for job in jobs:
+                self._add_mock(*_generate_mock(job))
+
+        f = open(os.path.join(self.path, "sim_paths" + suffix), 'w')
+        for sim in self.sims:
+            f.write(json.dumps(sim) + '\n')
         f.close()
 
-        os.chdir(self.old_path)
+        # create the run locs file
+        varied = set(name for sim in self.sims for name in sim['params'])
+        if self.legacy_names or len(varied) == 1:
+            f = open(os.path.join(self.path, "run_paths" + suffix), 'w')
+            for sim in self.sims:
+                f.write(str(list(sim['params'].values())[0]) + ' ' + 
+                        sim['run_dir'] + '\n')
+            f.close()
 
         return 0
+
+    def _legacy_name(self, point):
+        '''
+        The name of a mock made from free_params
+        '''
+        free_param_name, val = list(point.items())[0]
+        if free_param_name == 'theta' or free_param_name == 'phi':
+            return free_param_name + '{:.0f}'.format(val*180/np.pi)
+        return free_param_name + str(val)
+
+    def create_mock(self, point, name=None):
+        '''
+        The Single() for one point ({parameter: value}) of a sweep, with the 
+        settings of this Set. Named after its ID unless a name is given.
+        '''
+        param_vals = [(k, v) for k, v in self.fixed_params if k not in point]
+        param_vals += sorted(point.items())
+        mock = Single(name, 
+                      num_nights = self.num_nights,
+                      night_length = self.night_length,
+                      band_offset = self.band_offset,
+                      N_obs = self.N_obs,
+                      param_vals = param_vals,
+            model = self.model,
+            instrument = self.instrument,
+            telescope = self.telescope,
+            bands = self.bands,
+            S = self.S,
+            generate_extras = self.dump_extras, extras = self.extras,
+            night_gaps = self.night_gaps, schedules = self.schedules)
+        mock.sim_id = mock.get_id()
+        mock.point = point
+        if name is None:
+            mock.name = 'sim_' + mock.sim_id
+        return mock
+
+    def plan(self, sweep, shard=None):
+        '''
+        Yields the Single() of every point of the sweep (or of a shard of it,
+        shard = (index, count)) one at a time, without generating anything.
+        The settings come from generate_input_data.
+        '''
+        if shard is None:
+            points = iter(sweep)
+        else:
+            points = sweep.shard(*shard)
+        for point in points:
+            yield self.create_mock(point)
+
+    def _add_mock(self, mock, input_file_loc, run_dir):
+        self.mocks.append(mock)
+        self.input_files.append(input_file_loc)
+        self.run_dirs.append(run_dir)
+        params = dict((str(k), float(v)) for k, v in mock.point.items())
+        self.sims.append({'id': mock.sim_id, 'name': mock.name,
+                          'params': params, 'run_dir': run_dir})
+        if self.legacy_names:
+            self.run_locs[list(mock.point.values())[0]] = run_dir
+        else:
+            self.run_locs[mock.sim_id] = run_dir
     
     def generate_simulation(self, 
         param_file='/home/s1/kamile/analyses/all_free_params.json',
         num_walkers = 80,
         num_iterations =5000,
-        num_sims_per_screen=3):
+        num_sims_per_screen=3,
+        write_scripts=True,
+        num_scripts=None):
         '''
         Creates the files necessary for actually running the simulation.
 
@@ -321,77 +947,276 @@ class Set(object):
         number of walkers, and number of iterations, should specify all the 
         parameters of the simulations.
 
+        write_scripts: write the screen scripts (see create_bash_scripts). 
+        Without them the simulations can still be run with run().
+        num_scripts: balance the fits over this many screen scripts by their
+        predicted cost, instead of num_sims_per_screen fits per script
+
         generate_input_data needs to be run BEFORE this can be run
         '''
         self.simsperscsreen = num_sims_per_screen
         self.run_commands = []
-
-        os.chdir(self.path) # go back into the direcotry 
+        self.fit_jobs = [] # (ID, name, run dir, mosfit command) for run()
+        # to make the chunks of an adaptive run()
+        self.fit_settings = {'param_file': param_file, 
+                             'num_walkers': num_walkers,
+                             'num_iterations': num_iterations}
 
         for mock, input_file, run_loc in zip(self.mocks, self.input_files, self.run_dirs):
-            command = self.generate_mosfit_run_command(mock=mock,
-            run_loc = run_loc,
+            command = self.create_mosfit_fit_command(mock=mock,
             data_file = input_file,
             param_file = param_file,
             num_iterations = num_iterations,
             num_walkers = num_walkers)
 
-            self.run_commands.append(command)
+            self.fit_jobs.append((mock.sim_id, mock.name, run_loc, command))
+            self.run_commands.append(self.generate_mosfit_run_command(
+                mock=mock, run_loc=run_loc, command=command))
 
-        self.create_bash_scripts()
-        os.chdir(self.old_path)
+        if write_scripts:
+            self.create_bash_scripts(num_scripts=num_scripts)
 
         return 0
 
-    def generate_mosfit_run_command(self, mock=None,
-        run_loc = None,
+    def create_mosfit_fit_command(self, mock=None,
         data_file = None,
         param_file = None,
         num_iterations = 5000,
-        num_walkers = 10):
+        num_walkers = 10,
+        walker_paths = None):
+        '''
+        The MOSFiT command that fits one mock, to be run from its run dir.
+        walker_paths: a walkers.json (or a list of them) to start the 
+        walkers from instead of drawing them from the priors
+        '''
+        if mock == None:
+            raise ValueError('Single() Object Not Provided')
 
         if data_file == None:
             data_file = mock.dump_path
 
-        if run_loc == None:
-            raise ValueError('Simulation Location Not Specified')
-
         if param_file == None:
             raise ValueError('Parameter File Not Specified')
 
-        if mock == None:
-            raise ValueError('Single() Object Not Provided')
-
+        # the last observation may be later than the last night with gaps
+        max_time = max(self.num_nights + 1,
+                       int(np.ceil(mock.cadence.flat().max())))
 
         mosfit_command = ('mosfit -m ' + self.model + ' -e ' + data_file +
             ' -P '+  param_file +
             ' --band-instruments ' +  self.instrument + " --band-list " + 
-            " ".join(self.bands) + ' --max-time ' + str(self.num_nights + 1) + 
+            " ".join(self.bands) + ' --max-time ' + str(max_time) + 
             ' --no-copy-at-launch -N ' + str(num_walkers) + ' -i ' +
             str(num_iterations) + ' --local-data-only')
+        if walker_paths is not None:
+            if not isinstance(walker_paths, (list, tuple)):
+                walker_paths = [walker_paths]
+            mosfit_command += ' -w ' + ' '.join(walker_paths)
 
-        full_command = 'cd ' + run_loc + ' && ' + mosfit_command + ' && cd'
+        return mosfit_command
+
+    def generate_mosfit_run_command(self, mock=None,
+        run_loc = None,
+        data_file = None,
+        param_file = None,
+        num_iterations = 5000,
+        num_walkers = 10,
+        command = None):
+        '''
+        The shell line that runs the fit of one mock from its run dir, as it
+        goes in the run scripts. command is the output of 
+        create_mosfit_fit_command(), made from the other arguments if not 
+        given.
+        '''
+        if run_loc == None:
+            raise ValueError('Simulation Location Not Specified')
+
+        if command == None:
+            command = self.create_mosfit_fit_command(mock=mock,
+                data_file=data_file, param_file=param_file,
+                num_iterations=num_iterations, num_walkers=num_walkers)
+
+        full_command = 'cd ' + run_loc + ' && ' + command + ' && cd'
 
         return full_command 
 
-    def create_bash_scripts(self):
+    def run(self, max_parallel=None, threads_per_job=1, log_name='mosfit.log',
+            skip_done=False, target_psrf=None, chunk_iterations=500,
+            max_iterations=None, max_wall_time=None):
+        '''
+        Runs the fits made by generate_simulation from this process instead 
+        of through screen, at most max_parallel at a time (default: as many 
+        as fit on the cores with threads_per_job threads each).
+
+        The BLAS/OpenMP thread count of every MOSFiT is pinned to 
+        threads_per_job so that parallel fits don't oversubscribe the cores. 
+        The output of each fit goes to log_name in its run dir. Every fit is 
+        recorded in the manifest as it starts and ends.
+
+        skip_done: don't run fits that already left a valid walkers.json in
+        their run dir, see resume()
+
+        target_psrf: fit adaptively. Every fit runs in chunks of 
+        chunk_iterations iterations, each one continuing from the walkers of
+        the last, and stops as soon as the PSRF MOSFiT reports is at most 
+        target_psrf (e.g. 1.1), or before it would go over max_iterations 
+        (default: the num_iterations of generate_simulation) or, judging by
+        its last chunk, over max_wall_time seconds. The first chunk always
+        runs. Without target_psrf, every fit runs num_iterations 
+        iterations.
+
+        Returns one dictionary per simulation, in order, with its name, run 
+        dir, log, returncode, wall_time (seconds) and whether it was 
+        skipped. Adaptive fits also give the iterations run, the last psrf
+        and whether it converged. A fit that raised has returncode -1 and 
+        the error.
+        '''
+        if max_parallel is None:
+            max_parallel = max(1, multiprocessing.cpu_count() // threads_per_job)
+
+        adaptive = None
+        if target_psrf is not None:
+            if max_iterations is None:
+                max_iterations = self.fit_settings['num_iterations']
+            adaptive = {'target_psrf': target_psrf, 
+                        'chunk_iterations': chunk_iterations,
+                        'max_iterations': max_iterations,
+                        'max_wall_time': max_wall_time}
+
+        env = thread_limited_env(threads_per_job)
+        results = {}
+        jobs = []
+        for (sim_id, name, run_loc, command), mock, input_file in zip(
+                self.fit_jobs, self.mocks, self.input_files):
+            log_path = os.path.join(run_loc, log_name)
+            product = os.path.join(run_loc, 'products', 'walkers.json')
+            state = self.manifest.get(sim_id) or {}
+            # an adaptive fit leaves a valid walkers.json after every chunk,
+            # it's only done when the manifest says so
+            done = manifest_module.valid_walkers(product) and (
+                adaptive is None or not state.get('iterations') or 
+                state.get('phase') == manifest_module.DONE)
+            if skip_done and done:
+                print("Already fit " + name)
+                if state.get('phase') != manifest_module.DONE:
+                    self.manifest.record(sim_id, manifest_module.DONE, 
+                                         product=product)
+                results[sim_id] = {'name': name, 'run_dir': run_loc, 
+                                   'log': log_path, 'returncode': 0, 
+                                   'wall_time': 0.0, 'skipped': True}
+                continue
+            if adaptive is None:
+                jobs.append((sim_id, name, run_loc, command, log_path, env,
+                             self.manifest))
+                continue
+
+            if not skip_done and state.get('iterations'):
+                # start over rather than continue an earlier run
+                self.manifest.record(sim_id, manifest_module.FITTING, 
+                                     log=log_path, iterations=0, chunks=0)
+            commands = [self.create_mosfit_fit_command(
+                mock=mock, data_file=input_file,
+                param_file=self.fit_settings['param_file'],
+                num_iterations=chunk_iterations,
+                num_walkers=self.fit_settings['num_walkers'],
+                walker_paths=walker_paths) 
+                for walker_paths in (None, PREVIOUS_WALKERS)]
+            jobs.append((sim_id, name, run_loc, commands, log_path, env,
+                         self.manifest, adaptive))
+
+        # longest first, so that no long fit is left to run alone at the end
+        costs = dict(zip([job[0] for job in self.fit_jobs], 
+                         self.estimate_fit_costs(max_iterations)))
+        jobs.sort(key=lambda job: -costs[job[0]])
+        if jobs:
+            schedule.print_report(schedule.report(
+                [costs[job[0]] for job in jobs], schedule.pack(
+                    [costs[job[0]] for job in jobs], max_parallel)[1]))
+
+        # the fits are subprocesses, so threads are enough to wait on them
+        pool = ThreadPool(max_parallel)
+        try:
+            fit = _run_fit if adaptive is None else _run_adaptive_fit
+            for job, result in zip(jobs, pool.map(
+                    functools.partial(_guarded_fit, fit), jobs, chunksize=1)):
+                results[job[0]] = result
+        finally:
+            pool.close()
+            pool.join()
+
+        self.run_results = [results[job[0]] for job in self.fit_jobs]
+        return self.run_results
+
+    def resume(self, max_parallel=None, threads_per_job=1, 
+               log_name='mosfit.log', **adaptive):
+        '''
+        Runs the fits that haven't finished, e.g. after the machine went down 
+        halfway through run(). A fit is finished when its run dir holds a 
+        valid walkers.json; fits that were cut off or failed are run again.
+        Adaptive fits (adaptive: the target_psrf... arguments of run()) go 
+        on from their last finished chunk.
+
+        To resume a Set in a new process, make it again with the same 
+        arguments: generate_input_data skips the mocks in the manifest, then
+        generate_simulation and resume().
+        '''
+        return self.run(max_parallel=max_parallel, 
+                        threads_per_job=threads_per_job, log_name=log_name,
+                        skip_done=True, **adaptive)
+
+    def estimate_fit_costs(self, num_iterations=None, history=None):
+        '''
+        The predicted seconds of every fit of fit_jobs, see schedule.py. 
+        history: {run dir: seconds} of fits that already ran, by default 
+        those of the manifest and, if timing is on, the timing events.
+        num_iterations: defaults to that of generate_simulation
+        '''
+        if num_iterations is None:
+            num_iterations = self.fit_settings['num_iterations']
+        if history is None:
+            history = schedule.history_from_manifest(self.manifest)
+            if timing.enabled():
+                try:
+                    events = timing.read_events()
+                except IOError: # nothing recorded yet
+                    events = []
+                history.update(schedule.history_from_events(
+                    timing.in_directory(events, self.path)))
+        units = [schedule.cost_units(self.fit_settings['num_walkers'], 
+                                     num_iterations, len(mock.cadence.flat()))
+                 for mock in self.mocks]
+        return schedule.estimate(units, keys=self.run_dirs, history=history)
+
+    def create_bash_scripts(self, num_scripts=None, history=None):
         '''
         A helper that creats the script that will create the screen sessions 
         and run MOSFiT in generative mode
+
+        num_scripts: pack the fits into this many scripts so that they take
+        about as long as each other (see schedule.py, history as in 
+        estimate_fit_costs), and print the predicted makespan. By default
+        every script gets num_sims_per_screen fits in order.
         '''
         run_commands = self.get_all_run_commands()
-        k = self.simsperscsreen
-        run_blocks = [run_commands[i:i+k] for i in range(0, len(run_commands), k)]
+        if num_scripts is None:
+            k = self.simsperscsreen
+            run_blocks = [run_commands[i:i+k] 
+                          for i in range(0, len(run_commands), k)]
+        else:
+            costs = self.estimate_fit_costs(history=history)
+            bins, loads = schedule.pack(costs, num_scripts)
+            run_blocks = [[run_commands[i] for i in b] for b in bins if b]
+            schedule.print_report(schedule.report(costs, loads))
         # Write the inner scripts
         for i in range(0, len(run_blocks)):
-            f = open("run_script_" + str(i), 'w')
+            f = open(os.path.join(self.path, "run_script_" + str(i)), 'w')
             f.write("#!/usr/bin/env bash\n")
             for j in run_blocks[i]:
                 f.write(str(j)+'\n')
             f.close()
         
         # Now write the simulation script
-        f = open("simulation_script", 'w')
+        f = open(os.path.join(self.path, "simulation_script"), 'w')
         f.write("#!/usr/bin/env bash\n")
         f.write("chmod +x run_script_*\n")
         for i in range(0, len(run_blocks)):
@@ -404,8 +1229,30 @@ class Set(object):
         Returns the MOSFiT input commands of the simulation set
         '''
         return self.run_commands
+
+    def get_run_results(self):
+        '''
+        Returns the per simulation results of the last run()
+        '''
+        return self.run_results
         
     def get_run_paths(self):
         return self.run_locs
+
+    def get_timing_summary(self, events=None):
+        '''
+        timing.summarize() of the generation, input writing and fitting of 
+        the simulations of this Set. The events are read from the current
+        timing file unless given.
+        '''
+        if events is None:
+            events = timing.read_events()
+        return timing.summarize(timing.in_directory(events, self.path))
+
+    def get_sims(self):
+        '''
+        The ID, name, parameters and run dir of every simulation
+        '''
+        return self.sims
         
         
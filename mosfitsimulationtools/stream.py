@@ -0,0 +1,263 @@
+# MOSFiT Simulation Tools
+# stream.py
+# python2
+
+# MOSFiT  (https://github.com/SSantosLab/MOSFiT) REQUIRED
+# Built to work with the kasen_model model in MOSFIT (found in the SSantosLab
+# github)
+
+# A selective reader for the walkers.json files MOSFiT leaves in products/.
+# Those files are tens of thousands of lines long, but analysis only needs
+# the realization parameters and the photometry. Instead of building the
+# whole dictionary, the file is walked a chunk at a time and each
+# realization / photometry entry is decoded on its own, reduced to the
+# requested fields and thrown away.
+
+
+import itertools
+import json
+
+import jsonio
+
+CHUNK_SIZE = 1 << 16
+
+# Keys that can only appear at the top level of an event (as opposed to the
+# top level of a file that wraps the event in {name: event})
+EVENT_KEYS = set([u'name', u'schema', u'sources', u'alias', u'models',
+                  u'photometry'])
+
+_WHITESPACE = ' \t\n\r'
+
+
+class Reader(object):
+    '''
+    Walks a JSON file incrementally. The structure around the interesting
+    bits is navigated by hand, everything else is handed to the C decoder
+    one value at a time.
+    '''
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        '''
+        Reads another chunk, dropping the part of the buffer already consumed
+        '''
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        '''
+        Returns the next non-whitespace character without consuming it
+        '''
+        while True:
+            buf, pos = self.buf, self.pos
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            self.pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not self._fill():
+                raise ValueError('Unexpected end of JSON file')
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError('Expected ' + repr(char) + ' at offset ' +
+                             str(self.pos) + ', got ' + repr(self.peek()))
+        self.pos += 1
+
+    def value(self):
+        '''
+        Decodes the next complete value. If the value runs off the end of the
+        buffer more of the file is read and the decode is tried again.
+        '''
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if self._fill():
+                    continue
+                raise
+            # a number at the very end of the buffer may be cut in half
+            if end == len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return obj
+
+    def _separator(self, close):
+        '''
+        Consumes a ',' and returns True, or consumes the closing bracket and
+        returns False
+        '''
+        char = self.peek()
+        self.pos += 1
+        if char == ',':
+            return True
+        if char == close:
+            return False
+        raise ValueError('Expected , or ' + close + ' got ' + repr(char))
+
+    def keys(self):
+        '''
+        Iterates over the keys of the object at the current position. The
+        caller has to consume the value (value() or a nested walk) before
+        asking for the next key.
+        '''
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if not self._separator('}'):
+                return
+
+    def items(self):
+        '''
+        Iterates over the elements of the array at the current position,
+        yielding the index. Same contract as keys().
+        '''
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        i = 0
+        while True:
+            yield i
+            i += 1
+            if not self._separator(']'):
+                return
+
+
+def _select(i, stride, realizations):
+    '''
+    Whether the i'th (0 indexed) realization is kept
+    '''
+    if realizations is not None:
+        return i in realizations
+    return i % stride == 0
+
+
+def _project(entry, fields):
+    if fields is None:
+        return entry
+    return dict((k, entry[k]) for k in fields if k in entry)
+
+
+def select_parameters(parameters, params=None, free=False):
+    '''
+    {name: value} for the parameters of a realization.
+
+    params: the names to pick (None for all, unless free is set)
+    free: also pick every parameter that was free in the fit, MOSFiT only
+    records a 'fraction' for those
+    '''
+    if params is None and not free:
+        return dict((k, v[u'value']) for k, v in parameters.items())
+    values = {}
+    for k in params or ():
+        values[k] = parameters[k][u'value']
+    if free:
+        for k, v in parameters.items():
+            if u'fraction' in v:
+                values[k] = v[u'value']
+    return values
+
+
+def _read_model(reader, out, select, stride, realizations):
+    for key in reader.keys():
+        if key == u'realizations':
+            for i in reader.items():
+                realization = reader.value()
+                if not _select(i, stride, realizations):
+                    continue
+                values = select(realization[u'parameters'])
+                out['realizations'].append(values)
+                out['realization_ids'].append(i + 1)
+        elif key == u'convergence':
+            out['convergence'] = reader.value()
+        else:
+            reader.value()
+
+
+def _read_event(reader, keys, out, select, fields, stride, realizations):
+    for key in keys:
+        if key == u'models':
+            for i in reader.items():
+                if i == 0:
+                    _read_model(reader, out, select, stride, realizations)
+                else:
+                    reader.value()
+        elif key == u'photometry':
+            photometry = out['photometry']
+            subset = realizations is not None or stride != 1
+            for i in reader.items():
+                entry = reader.value()
+                if subset and u'realization' in entry and not _select(
+                        int(entry[u'realization']) - 1, stride, realizations):
+                    continue
+                photometry.append(_project(entry, fields))
+        elif key == u'name':
+            out['name'] = reader.value()
+        else:
+            reader.value()
+
+
+def read_walkers(path, params=None, free=False, fields=None, stride=1,
+                 realizations=None, chunk_size=CHUNK_SIZE):
+    '''
+    Reads only what is needed for analysis out of a MOSFiT output file.
+
+    params, free: the realization parameters to pull the values of, see
+    select_parameters()
+    fields: the photometry keys to keep (None for all)
+    stride: keep every stride'th realization
+    realizations: alternatively, the 0-indexed realizations to keep
+
+    Model photometry belonging to dropped realizations is dropped as well.
+
+    Returns a dictionary with
+        - realizations: list of {param: value}, one per kept realization
+        - realization_ids: the (1-indexed) realization number of each
+        - photometry: the photometry entries, in file order
+        - convergence: the convergence entries of the first model
+        - name: the name of the event
+    '''
+    if realizations is not None:
+        realizations = set(realizations)
+
+    def select(parameters):
+        return select_parameters(parameters, params, free)
+
+    out = {'realizations': [], 'realization_ids': [], 'photometry': [],
+           'convergence': [], 'name': None}
+
+    with jsonio.open_text(path) as f:
+        reader = Reader(f, chunk_size=chunk_size)
+        keys = reader.keys()
+        first = next(keys)
+        if first in EVENT_KEYS:
+            # the event is the top level object
+            _read_event(reader, itertools.chain([first], keys), out, select,
+                        fields, stride, realizations)
+        else:
+            # {name: event}, like the eager path only the first one is read
+            out['name'] = first
+            _read_event(reader, reader.keys(), out, select, fields, stride,
+                        realizations)
+            for _ in keys:
+                reader.value()
+
+    return out
@@ -0,0 +1,213 @@
+# MOSFiT Simulation Tools
+# sweep.py
+# python2
+
+# MOSFiT  (https://github.com/SSantosLab/MOSFiT) REQUIRED
+# Built to work with the kasen_model model in MOSFIT (found in the SSantosLab
+# github)
+
+# Parameter sweeps for simulate.Set. A sweep is a list of points, each point
+# a dictionary {parameter: value}, that is never built in full: every point
+# can be computed from its index, so a sweep can be iterated lazily or cut
+# into shards that different machines generate.
+
+# Parameter ranges are given as (name, low, high), or (name, low, high, 'log')
+# for parameters like xlan that span decades.
+
+
+import numpy as np
+
+
+class Sweep(object):
+    '''
+    The base of all sweeps. Subclasses implement __len__ and point(i).
+    '''
+    def __len__(self):
+        raise NotImplementedError
+
+    def point(self, i):
+        '''
+        The i'th point of the sweep as {parameter: value}
+        '''
+        raise NotImplementedError
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.point(i)
+
+    def shard(self, index, count):
+        '''
+        The points of shard index (0 <= index < count) when the sweep is cut
+        into count shards. Points are dealt out in turn, so shards are within
+        one point of each other in size and each is spread over the sweep.
+        '''
+        if not 0 <= index < count:
+            raise ValueError('Shard ' + str(index) + ' out of ' + str(count))
+        for i in range(index, len(self), count):
+            yield self.point(i)
+
+
+class Grid(Sweep):
+    '''
+    Every combination of the given values, e.g.
+    Grid([('theta', np.linspace(0, 1.57, 10)), ('Msph1', [0.01, 0.04])])
+    The last parameter varies fastest.
+    '''
+    def __init__(self, axes):
+        self.names = [name for name, _ in axes]
+        self.values = [list(values) for _, values in axes]
+        self.shape = tuple(len(values) for values in self.values)
+
+    def __len__(self):
+        return int(np.prod(self.shape)) if self.shape else 0
+
+    def point(self, i):
+        index = np.unravel_index(i, self.shape)
+        return dict((name, values[j]) for name, values, j in
+                    zip(self.names, self.values, index))
+
+
+class _Ranges(Sweep):
+    '''
+    A sweep that maps points in the unit cube onto parameter ranges
+    '''
+    def __init__(self, ranges, num):
+        self.names = [r[0] for r in ranges]
+        self.log = np.array([len(r) > 3 and r[3] == 'log' for r in ranges])
+        low = np.array([float(r[1]) for r in ranges])
+        high = np.array([float(r[2]) for r in ranges])
+        self.low = np.where(self.log, np.log10(np.where(self.log, low, 1.)), low)
+        self.high = np.where(self.log, np.log10(np.where(self.log, high, 1.)),
+                             high)
+        self.num = num
+
+    def __len__(self):
+        return self.num
+
+    def _scale(self, unit):
+        values = self.low + unit*(self.high - self.low)
+        values = np.where(self.log, 10**values, values)
+        return dict((name, float(v)) for name, v in zip(self.names, values))
+
+    def point(self, i):
+        if not 0 <= i < self.num:
+            raise IndexError(i)
+        return self._scale(self._unit(i))
+
+
+class LatinHypercube(_Ranges):
+    '''
+    A Latin hypercube of num points: every parameter range is cut into num
+    slices and each slice holds exactly one point
+    '''
+    def __init__(self, ranges, num, seed=0):
+        _Ranges.__init__(self, ranges, num)
+        self.seed = seed
+        self._cells = None
+
+    def _unit(self, i):
+        if self._cells is None:
+            # num x dims numbers, far smaller than the Singles they become
+            random = np.random.RandomState(self.seed)
+            slots = np.array([random.permutation(self.num)
+                              for _ in self.names]).T
+            self._cells = (slots + random.uniform(size=slots.shape))/self.num
+        return self._cells[i]
+
+
+class RandomDraws(_Ranges):
+    '''
+    num points drawn uniformly (log-uniformly for 'log' ranges). Point i only
+    depends on seed and i.
+    '''
+    def __init__(self, ranges, num, seed=0):
+        _Ranges.__init__(self, ranges, num)
+        self.seed = seed
+
+    def _unit(self, i):
+        return np.random.RandomState([self.seed, i]).uniform(
+            size=len(self.names))
+
+
+# Direction numbers (Joe & Kuo, new-joe-kuo-6.21201) for the dimensions
+# after the first, as (s, a, m_1..m_s)
+_SOBOL_DIRECTIONS = [(1, 0, [1]), (2, 1, [1, 3]), (3, 1, [1, 3, 1]),
+                     (3, 2, [1, 1, 1]), (4, 1, [1, 1, 3, 3]),
+                     (4, 4, [1, 3, 5, 13]), (5, 2, [1, 1, 5, 5, 17]),
+                     (5, 4, [1, 1, 5, 5, 5]), (5, 7, [1, 1, 7, 11, 19]),
+                     (5, 11, [1, 1, 5, 1, 1]), (5, 13, [1, 1, 1, 3, 11]),
+                     (5, 14, [1, 3, 5, 5, 31])]
+
+_SOBOL_BITS = 32
+
+
+def _sobol_directions(dims):
+    '''
+    The (dims x _SOBOL_BITS) direction numbers of a Sobol sequence
+    '''
+    if dims > len(_SOBOL_DIRECTIONS) + 1:
+        raise ValueError('Sobol sweeps support at most ' +
+                         str(len(_SOBOL_DIRECTIONS) + 1) + ' parameters')
+    v = np.zeros((dims, _SOBOL_BITS), dtype=np.uint64)
+    # the first dimension is the van der Corput sequence
+    v[0] = [1 << (_SOBOL_BITS - 1 - k) for k in range(_SOBOL_BITS)]
+    for d in range(1, dims):
+        s, a, m = _SOBOL_DIRECTIONS[d - 1]
+        directions = [m[k] << (_SOBOL_BITS - 1 - k) for k in range(s)]
+        for k in range(s, _SOBOL_BITS):
+            value = directions[k - s] ^ (directions[k - s] >> s)
+            for j in range(1, s):
+                if (a >> (s - 1 - j)) & 1:
+                    value ^= directions[k - j]
+            directions.append(value)
+        v[d] = directions
+    return v
+
+
+class Sobol(_Ranges):
+    '''
+    The first num points of a Sobol sequence (skipping the first skip
+    points, the first one being the corner of the cube)
+    '''
+    def __init__(self, ranges, num, skip=1):
+        _Ranges.__init__(self, ranges, num)
+        self.skip = skip
+        self._directions = _sobol_directions(len(self.names))
+
+    def _unit(self, i):
+        # point n is the xor of the direction numbers of the bits set in
+        # the Gray code of n
+        n = i + self.skip
+        gray = n ^ (n >> 1)
+        x = np.zeros(len(self.names), dtype=np.uint64)
+        bit = 0
+        while gray:
+            if gray & 1:
+                x ^= self._directions[:, bit]
+            gray >>= 1
+            bit += 1
+        return x/float(1 << _SOBOL_BITS)
+
+
+class Points(Sweep):
+    '''
+    An explicit list of points, e.g. the old free_params of simulate.Set
+    '''
+    def __init__(self, points):
+        self.points = list(points)
+
+    def __len__(self):
+        return len(self.points)
+
+    def point(self, i):
+        return dict(self.points[i])
+
+
+def one_at_a_time(free_params):
+    '''
+    The sweep that simulate.Set.generate_input_data makes of free_params:
+    each parameter is varied on its own
+    '''
+    return Points({name: val} for name, values in free_params
+                  for val in values)
+
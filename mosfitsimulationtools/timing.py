@@ -0,0 +1,208 @@
+# MOSFiT Simulation Tools
+# timing.py
+# python2
+
+# MOSFiT  (https://github.com/SSantosLab/MOSFiT) REQUIRED
+# Built to work with the kasen_model model in MOSFIT (found in the SSantosLab
+# github)
+
+# Opt-in instrumentation of where the time of a sweep goes. Once enabled,
+# the generation, input writing and fitting of every simulation, the parsing
+# of every walkers.json and every plot are recorded as one JSON line each:
+#   {"event": "simulate.fit", "start": ..., "wall": ..., "cpu": ...,
+#    "pid": ..., "name": ..., "child_utime": ..., "child_maxrss_mb": ...}
+# wall and cpu are seconds, cpu being the time of this process; the child_
+# fields are the resources of the MOSFiT process behind the event.
+#
+#   mst.timing.enable('timing.jsonl')   (or MST_TIMING=timing.jsonl)
+#   ... generate, run, analyze, plot ...
+#   simulation.get_timing_summary()
+#
+# Processes forked after enable() (e.g. by analyze.Set) record to the same
+# file. Nothing is recorded unless enabled.
+
+
+import contextlib
+import functools
+import json
+import os
+import subprocess
+import time
+
+import numpy as np
+
+# the events go to the file this names, if it is set when the module is
+# imported
+TIMING_ENV_VAR = 'MST_TIMING'
+
+_path = None
+
+
+def enable(path):
+    '''
+    Starts recording events, appending them to the JSON-lines file at path
+    '''
+    global _path
+    _path = os.path.abspath(path)
+
+
+def disable():
+    global _path
+    _path = None
+
+
+def enabled():
+    return _path is not None
+
+
+def _cpu():
+    times = os.times()
+    return times[0] + times[1]
+
+
+def _write(fields):
+    line = (json.dumps(fields, sort_keys=True) + '\n').encode('utf-8')
+    # one write to a file opened for appending, so that the lines of
+    # threads and processes don't interleave
+    fd = os.open(_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+@contextlib.contextmanager
+def span(event, **fields):
+    '''
+    Records the time spent in a with block as event. The block gets the
+    dictionary of fields of the event and can add to it.
+    '''
+    if _path is None:
+        yield fields
+        return
+    start = time.time()
+    cpu = _cpu()
+    try:
+        yield fields
+    except BaseException as e:
+        fields['error'] = type(e).__name__ + ': ' + str(e)
+        raise
+    finally:
+        if _path is not None: # may have been disabled in the block
+            fields.update({'event': event, 'start': start,
+                           'wall': time.time() - start, 'cpu': _cpu() - cpu,
+                           'pid': os.getpid()})
+            _write(fields)
+
+
+def timed(event, fields=None):
+    '''
+    A decorator that records every call of a function as event. fields, if
+    given, is called with the arguments of the function and returns the
+    fields of the event.
+    '''
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _path is None:
+                return function(*args, **kwargs)
+            extra = fields(*args, **kwargs) if fields is not None else {}
+            with span(event, **extra):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def call(command, fields=None, **kwargs):
+    '''
+    subprocess.call, that also puts the CPU time and peak memory of the
+    process (and of the processes it waited for, e.g. the MOSFiT under a
+    shell) in fields. Returns the exit code.
+    '''
+    process = subprocess.Popen(command, **kwargs)
+    try:
+        _, status, usage = os.wait4(process.pid, 0)
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    if os.WIFSIGNALED(status):
+        returncode = -os.WTERMSIG(status)
+    else:
+        returncode = os.WEXITSTATUS(status)
+    process.returncode = returncode
+
+    if fields is not None:
+        fields['returncode'] = returncode
+        fields['child_utime'] = usage.ru_utime
+        fields['child_stime'] = usage.ru_stime
+        fields['child_maxrss_mb'] = usage.ru_maxrss/1024. # kB on Linux
+    return returncode
+
+
+def read_events(path=None):
+    '''
+    The events recorded in path (the current file by default). Lines cut
+    off by a crash are skipped.
+    '''
+    events = []
+    with open(path or _path, 'r') as f:
+        for line in f:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                continue
+    return events
+
+
+def in_directory(events, directory):
+    '''
+    The events whose path is in directory
+    '''
+    directory = os.path.join(os.path.abspath(directory), '')
+    return [e for e in events
+            if os.path.join(e.get('path', ''), '').startswith(directory)]
+
+
+def summarize(events, label='name'):
+    '''
+    {event: statistics} of a list of events: count, errors, the total, mean,
+    median, 90th percentile and maximum of the wall times, the total CPU
+    time of this process and of the children, the largest child peak
+    memory, and the label field (or path) of the slowest one
+    '''
+    groups = {}
+    for event in events:
+        groups.setdefault(event['event'], []).append(event)
+
+    summary = {}
+    for name, group in groups.items():
+        wall = np.array([e['wall'] for e in group])
+        slowest = group[int(np.argmax(wall))]
+        child_cpu = [e.get('child_utime', 0.) + e.get('child_stime', 0.)
+                     for e in group]
+        child_rss = [e['child_maxrss_mb'] for e in group
+                     if 'child_maxrss_mb' in e]
+        summary[name] = {
+            'count': len(group),
+            'errors': sum(1 for e in group if 'error' in e or
+                          e.get('returncode', 0) != 0),
+            'wall_total': float(wall.sum()),
+            'wall_mean': float(wall.mean()),
+            'wall_median': float(np.median(wall)),
+            'wall_p90': float(np.percentile(wall, 90)),
+            'wall_max': float(wall.max()),
+            'slowest': slowest.get(label, slowest.get('path')),
+            'cpu_total': float(sum(e['cpu'] for e in group)),
+            'child_cpu_total': float(sum(child_cpu)),
+            'child_maxrss_mb': max(child_rss) if child_rss else None}
+    return summary
+
+
+def write_summary(summary, path):
+    with open(path, 'w') as f:
+        json.dump(summary, f, indent=2, sort_keys=True)
+
+
+if os.environ.get(TIMING_ENV_VAR):
+    enable(os.environ[TIMING_ENV_VAR])
@@ -0,0 +1,190 @@
+# MOSFiT Simulation Tools
+# worker.py
+# python2
+
+# MOSFiT  (https://github.com/SSantosLab/MOSFiT) REQUIRED
+# Built to work with the kasen_model model in MOSFIT (found in the SSantosLab
+# github)
+
+# Long lived MOSFiT processes for generating mocks. Starting mosfit for every
+# mock means starting python and importing MOSFiT (and numpy, scipy,
+# astropy...) every time. A WorkerPool starts its workers once, imports
+# MOSFiT in them once and hands them one generation after the other. That
+# is all it saves: MOSFiT's main() builds the model, kasen_model SED tables
+# included, again for every run, in a worker as in its own process.
+#
+# Measured with the fake mosfit of tests/benchmarks (python and numpy to
+# start, no model), the 'simulate.Set.generate_input_data' benchmarks: 8
+# mocks on one worker take 0.06 s on a pool and 0.9 s with a process per 
+# mock, about 0.1 s saved per mock. With MOSFiT the saving is its import 
+# time per mock (not measured here); the model loading is not saved.
+
+# A worker is this file run as a script. It reads one JSON request per line
+# on stdin, {"args": [mosfit arguments], "cwd": directory}, runs MOSFiT with
+# those arguments in that directory and answers with one JSON line on stdout,
+# {"returncode": ..., "error": ...}. Everything MOSFiT prints goes to stderr.
+# Any program that speaks this protocol can stand in for it (see
+# tests/standin_worker.py).
+
+
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import threading
+import traceback
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+WORKER_SCRIPT = os.path.splitext(os.path.abspath(__file__))[0] + '.py'
+
+
+def mosfit_main(args):
+    '''
+    Runs MOSFiT like 'mosfit args' would, in this process
+    '''
+    from mosfit.main import main
+    sys.argv = ['mosfit'] + list(args)
+    main()
+
+
+def serve(handler, preload=None):
+    '''
+    The worker loop: answers the requests on stdin with handler(args), run
+    in the requested directory, until stdin is closed.
+
+    preload: called once before the first request, to import and load what
+    every request needs
+    '''
+    # keep the real stdout for the answers, whatever the handler prints ends
+    # up on stderr
+    answers = os.fdopen(os.dup(1), 'w')
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+
+    if preload is not None:
+        preload()
+
+    for line in iter(sys.stdin.readline, ''):
+        request = json.loads(line)
+        returncode, error = 0, None
+        try:
+            os.chdir(request['cwd'])
+            handler(request['args'])
+        except SystemExit as e:
+            if e.code is None:
+                returncode = 0
+            elif isinstance(e.code, int):
+                returncode = e.code
+            else:
+                returncode, error = 1, str(e.code)
+        except Exception:
+            returncode, error = 1, traceback.format_exc()
+        sys.stderr.flush()
+        answers.write(json.dumps({'returncode': returncode, 'error': error}) +
+                      '\n')
+        answers.flush()
+
+
+class WorkerPool(object):
+    '''
+    size worker processes (default: one per core) that generate mocks, to be
+    given to simulate.Set.generate_input_data or simulate.Single.generate.
+    call() hands a generation to the next idle worker, so a pool can be
+    used from as many threads as it has workers.
+
+    command: the command that starts a worker, this file by default
+
+    A worker that dies is replaced by a new one and its generation reported
+    as failed. Close the pool (or use it in a with block) when done.
+    '''
+    def __init__(self, size=None, command=None, env=None):
+        if size is None:
+            size = multiprocessing.cpu_count()
+        if command is None:
+            command = [sys.executable, WORKER_SCRIPT]
+        self.size = size
+        self.command = list(command)
+        self.env = env
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = []
+        for _ in range(size):
+            self._idle.put(self._start())
+
+    def _start(self):
+        worker = subprocess.Popen(self.command, stdin=subprocess.PIPE,
+                                  stdout=subprocess.PIPE, env=self.env,
+                                  close_fds=True, universal_newlines=True)
+        with self._lock:
+            self._workers.append(worker)
+        return worker
+
+    def _stop(self, worker):
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+        if worker.poll() is None:
+            worker.kill()
+        worker.wait()
+
+    def call(self, args, cwd):
+        '''
+        Runs MOSFiT with args (a list of arguments) in the directory cwd on a
+        worker. Returns the exit code, like subprocess.call.
+        '''
+        worker = self._idle.get()
+        try:
+            try:
+                worker.stdin.write(json.dumps({'args': list(args),
+                                               'cwd': cwd}) + '\n')
+                worker.stdin.flush()
+                answer = worker.stdout.readline()
+            except (IOError, OSError):
+                answer = ''
+            if not answer:
+                print("MOSFiT worker died running in " + cwd +
+                      ", starting a new one")
+                self._stop(worker)
+                worker = self._start()
+                return -1
+            answer = json.loads(answer)
+            if answer['error']:
+                print("MOSFiT worker failed in " + cwd + ": " +
+                      answer['error'])
+            return answer['returncode']
+        finally:
+            self._idle.put(worker)
+
+    def close(self):
+        '''
+        Lets the workers finish and waits for them to exit
+        '''
+        with self._lock:
+            workers = list(self._workers)
+            self._workers = []
+        for worker in workers:
+            try:
+                worker.stdin.close()
+            except (IOError, OSError):
+                pass
+        for worker in workers:
+            worker.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == '__main__':
+    def preload():
+        # the imports only, main() loads the model for each request
+        import mosfit.main
+
+    serve(mosfit_main, preload=preload)
@@ -0,0 +1,357 @@
+# MOSFiT Simulation Tools
+# run.py
+# python2
+
+# Benchmarks of the analysis, orchestration and plotting code, on synthetic
+# MOSFiT products (synthetic.py) and with a fake mosfit (bin/mosfit), so no
+# MOSFiT is needed. Every benchmark runs in a fresh process, timing repeats
+# of its run and recording the peak memory of the process.
+#
+#   python run.py --output results.json
+#   python run.py --output new.json --compare results.json
+#
+# The results file holds the commit, the versions and one entry per
+# benchmark, so the results of two versions can be compared.
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', '..'))
+sys.path.insert(0, HERE)
+
+import numpy as np
+
+import mosfitsimulationtools as mst
+import synthetic
+
+# name -> (setup function, parameters), setup(directory, **parameters)
+# prepares a benchmark and returns the function to time
+BENCHMARKS = []
+
+
+def benchmark(name, **parameters):
+    def register(setup):
+        BENCHMARKS.append((name, setup, parameters))
+        return setup
+    return register
+
+
+# ------------------------------------------------------------------- analyze
+
+for realizations in (80, 400):
+    for streaming in (False, True):
+        @benchmark('analyze.Single', realizations=realizations,
+                   streaming=streaming)
+        def single_load(directory, realizations, streaming):
+            path = synthetic.write_walkers(
+                os.path.join(directory, 'walkers.json'),
+                realizations=realizations)
+            return lambda: mst.analyze.Single('theta', 0.0, path,
+                                              streaming=streaming)
+
+
+for sims in (10, 40):
+    @benchmark('analyze.Set', sims=sims, realizations=80)
+    def set_load(directory, sims, realizations):
+        run_paths = synthetic.write_set(directory,
+                                        values=np.linspace(0, 1.57, sims),
+                                        realizations=realizations)
+        return lambda: mst.analyze.Set('theta', run_paths)
+
+    @benchmark('analyze.Set', sims=sims, realizations=80,
+               memory_budget=2**20)
+    def set_load_lazy(directory, sims, realizations, memory_budget):
+        run_paths = synthetic.write_set(directory,
+                                        values=np.linspace(0, 1.57, sims),
+                                        realizations=realizations)
+        return lambda: mst.analyze.Set('theta', run_paths,
+                                       memory_budget=memory_budget)
+
+    @benchmark('analyze.Set.get_summary', sims=sims, realizations=80)
+    def set_summary(directory, sims, realizations):
+        run_paths = synthetic.write_set(directory,
+                                        values=np.linspace(0, 1.57, sims),
+                                        realizations=realizations)
+        results = mst.analyze.Set('theta', run_paths)
+
+        def run():
+            # the summary of every simulation, not the rows kept from the
+            # last call
+            results._summary_rows.clear()
+            results.get_summary()
+        return run
+
+    @benchmark('analyze.Set.from_store', sims=sims, realizations=80)
+    def set_from_store(directory, sims, realizations):
+        run_paths = synthetic.write_set(directory,
+                                        values=np.linspace(0, 1.57, sims),
+                                        realizations=realizations)
+        path = mst.analyze.Set('theta', run_paths).export(
+            os.path.join(directory, 'set.store'))
+        return lambda: mst.analyze.Set.from_store(path)
+
+    @benchmark('analyze.Set.refresh', sims=sims, realizations=80, changed=1)
+    def set_refresh(directory, sims, realizations, changed):
+        run_paths = synthetic.write_set(directory,
+                                        values=np.linspace(0, 1.57, sims),
+                                        realizations=realizations)
+        results = mst.analyze.Set('theta', run_paths)
+        paths = [line.split()[1] + '/products/walkers.json'
+                 for line in open(run_paths)][:changed]
+
+        def run():
+            for path in paths:
+                os.utime(path, None)
+            results.refresh()
+            results.get_summary()
+        return run
+
+
+# ------------------------------------------------------------------ simulate
+
+def fake_mosfit_env():
+    os.environ['PATH'] = (os.path.join(HERE, 'bin') + os.pathsep +
+                          os.environ['PATH'])
+
+
+for nights, N_obs in ((3, 4), (30, 24)):
+    @benchmark('simulate.Single.generate_times', num_nights=nights,
+               N_obs=N_obs)
+    def generate_times(directory, num_nights, N_obs):
+        mock = mst.simulate.Single('mock', num_nights=num_nights, N_obs=N_obs)
+        return mock.generate_times
+
+    @benchmark('simulate.Single.generate_input_file', num_nights=nights,
+               N_obs=N_obs)
+    def generate_input_file(directory, num_nights, N_obs):
+        fake_mosfit_env()
+        mock = mst.simulate.Single('mock', num_nights=num_nights, N_obs=N_obs)
+        with open(os.devnull, 'w') as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                mock.generate(directory)
+            finally:
+                sys.stdout = stdout
+        return mock.generate_input_file
+
+
+# a mosfit process per mock against a WorkerPool started once (which is
+# kept out of the timing, like for a whole campaign of Sets), with the
+# start up of the fake mosfit taking startup seconds on top of starting
+# python and importing numpy
+for workers in (1, 4):
+    for startup in (0, 0.5):
+        for persistent in (False, True):
+            @benchmark('simulate.Set.generate_input_data', sims=8,
+                       workers=workers, startup=startup,
+                       persistent=persistent)
+            def set_generate(directory, sims, workers, startup, persistent):
+                fake_mosfit_env()
+                os.environ['FAKE_MOSFIT_STARTUP'] = str(startup)
+                os.chdir(directory)
+                count = [0]
+                pool = None
+                if persistent:
+                    pool = mst.worker.WorkerPool(workers, command=[
+                        sys.executable, os.path.join(HERE, 'bin', 'mosfit'),
+                        '--worker'])
+
+                def run():
+                    count[0] += 1
+                    simulation = mst.simulate.Set('set' + str(count[0]))
+                    simulation.generate_input_data(
+                        bands=['g', 'z'], workers=workers, pool=pool,
+                        free_params=[('theta', np.linspace(0, 1.57, sims))])
+                return run
+
+
+# ------------------------------------------------------------------ plotting
+
+def plotting_setup(directory):
+    import matplotlib.pyplot as plt
+    path = synthetic.write_walkers(os.path.join(directory, 'walkers.json'),
+                                   realizations=80)
+    single = mst.analyze.Single('theta', 0.5, path)
+    plotting = mst.plotting.Plotting()
+
+    def timed(draw):
+        def run():
+            draw()
+            plt.close('all')
+        return run
+    return plt, path, single, plotting, timed
+
+
+@benchmark('plotting.single_corner')
+def single_corner(directory):
+    plt, path, single, plotting, timed = plotting_setup(directory)
+    name = os.path.join(directory, 'corner.png')
+    return timed(lambda: plotting.single_corner(single, name=name, save=True))
+
+
+@benchmark('plotting.single_comparison')
+def single_comparison(directory):
+    plt, path, single, plotting, timed = plotting_setup(directory)
+    name = os.path.join(directory, 'comparison.png')
+    return timed(lambda: plotting.single_comparison(single, name=name,
+                                                    save=True))
+
+
+@benchmark('plotting.money_plot', sims=10)
+def money_plot(directory, sims):
+    plt, path, single, plotting, timed = plotting_setup(directory)
+    results = mst.analyze.Set('theta', synthetic.write_set(
+        os.path.join(directory, 'set'), values=np.linspace(0, 1.57, sims)))
+    name = os.path.join(directory, 'money.png')
+    return timed(lambda: plotting.money_plot(results, name=name, save=True))
+
+
+@benchmark('plotting.single_raw')
+def single_raw(directory):
+    plt, path, single, plotting, timed = plotting_setup(directory)
+    name = os.path.join(directory, 'raw.png')
+    return timed(lambda: plotting.single_raw(data_path=path, name=name,
+                                             save=True))
+
+
+@benchmark('plotting.single_raw_comparison', files=4)
+def single_raw_comparison(directory, files):
+    plt, path, single, plotting, timed = plotting_setup(directory)
+    paths = [synthetic.write_walkers(os.path.join(directory, str(i) + '.json'),
+                                     realizations=10, seed=i)
+             for i in range(files)]
+    name = os.path.join(directory, 'raw_comparison.png')
+    return timed(lambda: plotting.single_raw_comparison(
+        data_paths=paths, labels=[str(i) for i in range(files)], name=name,
+        save=True))
+
+
+# -------------------------------------------------------------------- runner
+
+def _max_rss_mb():
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.
+
+
+def _measure(setup, parameters, repeats, connection):
+    '''
+    Runs one benchmark, in its own process so that the peak memory is its own
+    '''
+    directory = tempfile.mkdtemp(prefix='mst_benchmark_')
+    cwd = os.getcwd()
+    try:
+        run = setup(directory, **parameters)
+        rss_setup = _max_rss_mb()
+        times = []
+        with open(os.devnull, 'w') as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                for _ in range(repeats):
+                    start = time.time()
+                    run()
+                    times.append(time.time() - start)
+            finally:
+                sys.stdout = stdout
+        rss_peak = _max_rss_mb()
+        connection.send({'times': times, 'best': min(times),
+                         'mean': sum(times)/len(times),
+                         'peak_rss_mb': rss_peak,
+                         'rss_growth_mb': rss_peak - rss_setup})
+    except Exception as e:
+        connection.send({'error': type(e).__name__ + ': ' + str(e)})
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory, ignore_errors=True)
+        connection.close()
+
+
+def run_benchmark(setup, parameters, repeats):
+    receive, send = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_measure,
+                                      args=(setup, parameters, repeats, send))
+    process.start()
+    send.close()
+    try:
+        result = receive.recv()
+    except EOFError:
+        result = {'error': 'benchmark process died'}
+    process.join()
+    return result
+
+
+def environment():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                         cwd=HERE).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    if isinstance(commit, bytes):
+        commit = commit.decode('ascii')
+    import matplotlib
+    return {'commit': commit, 'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(), 'numpy': np.__version__,
+            'matplotlib': matplotlib.__version__,
+            'json_backend': mst.jsonio.backend,
+            'machine': platform.platform(),
+            'cpus': multiprocessing.cpu_count()}
+
+
+def key(result):
+    return result['name'] + ' ' + json.dumps(result['parameters'],
+                                             sort_keys=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help='where the results go (JSON)')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--filter', default='',
+                        help='only the benchmarks whose name contains this')
+    parser.add_argument('--compare', default=None,
+                        help='an older results file to compare against')
+    args = parser.parse_args()
+
+    results = []
+    for name, setup, parameters in BENCHMARKS:
+        if args.filter not in name:
+            continue
+        result = {'name': name, 'parameters': parameters,
+                  'repeats': args.repeats}
+        result.update(run_benchmark(setup, parameters, args.repeats))
+        results.append(result)
+        if 'error' in result:
+            print('{0:<70} failed: {1}'.format(key(result), result['error']))
+        else:
+            print('{0:<70} {1:9.4f} s {2:8.1f} MB'.format(
+                key(result), result['best'], result['peak_rss_mb']))
+
+    with open(args.output, 'w') as f:
+        json.dump({'environment': environment(), 'results': results}, f,
+                  indent=2, sort_keys=True)
+
+    if args.compare is not None:
+        with open(args.compare, 'r') as f:
+            old = dict((key(result), result)
+                       for result in json.load(f)['results'])
+        print('\nbest time / best time of ' + args.compare)
+        for result in results:
+            before = old.get(key(result))
+            if before is None or 'best' not in before or 'best' not in result:
+                continue
+            print('{0:<70} {1:6.2f}x'.format(key(result),
+                                             result['best']/before['best']))
+
+
+if __name__ == '__main__':
+    main()
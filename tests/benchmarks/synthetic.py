@@ -0,0 +1,148 @@
+# MOSFiT Simulation Tools
+# synthetic.py
+# python2
+
+# Synthetic MOSFiT products for the benchmarks: walkers.json files in the
+# schema MOSFiT writes (see tests/test/theta0/run/products/walkers.json) with
+# as many realizations, bands, epochs and parameters as asked for, and whole
+# fitted Sets of them for analyze.Set.
+
+import json
+import os
+
+import numpy as np
+
+BANDS = ['u', 'g', 'r', 'i', 'z', 'Y']
+
+# the parameters of kasen_model, with the values of the mocks in the tests
+PARAMETERS = [('Msph0', 0.025), ('Msph1', 0.04), ('phi', 0.7), ('theta', 0.0),
+              ('vk0', 0.3), ('vk1', 0.1), ('xlan0', 1e-4), ('xlan1', 1e-2),
+              ('texplosion', 0.0), ('redshift', 0.009727), ('lumdist', 43.36),
+              ('variance', 1.0), ('codeltatime', -1.0),
+              ('codeltalambda', -1.0)]
+
+
+def parameter_names(num):
+    '''
+    num parameter names, the kasen_model ones first
+    '''
+    names = [name for name, _ in PARAMETERS[:num]]
+    return names + ['param' + str(i) for i in range(len(names), num)]
+
+
+def epochs(num, nights=3):
+    '''
+    num observation times spread over nights
+    '''
+    return np.round(np.linspace(0., nights + 0.01, num), 6)
+
+
+def walkers(name='kasen_model', realizations=80, bands=BANDS[1:5:3],
+            times=None, num_epochs=13, params=8, free=('theta',),
+            truths=None, observed=True, seed=0):
+    '''
+    The dictionary of a walkers.json
+
+    realizations: number of realizations (walkers) in the model
+    bands, times: photometry is made for every band at every time (times
+    defaults to num_epochs epochs), or at times[band] if times is a dict
+    params: the number of parameters, or their names
+    free: the parameters that were fitted, they scatter around their truth
+    and get a 'fraction' like in MOSFiT output
+    truths: {param: value}, defaults to the kasen_model values
+    observed: whether the photometry includes the observations fitted to,
+    as in the output of a fit (a generative run has none)
+    '''
+    random = np.random.RandomState(seed)
+    if times is None:
+        times = epochs(num_epochs)
+    if not isinstance(times, dict):
+        times = dict((band, times) for band in bands)
+    if isinstance(params, int):
+        params = parameter_names(params)
+    values = dict(PARAMETERS)
+    values.update(truths or {})
+
+    models = []
+    for r in range(realizations):
+        parameters = {}
+        for param in params:
+            value = values.get(param, 1.0)
+            parameters[param] = {'latex': param, 'log': False, 'value': value}
+            if param in free:
+                parameters[param]['value'] = value + 0.05*random.randn()
+                parameters[param]['fraction'] = random.uniform()
+        score = -20*random.uniform()
+        models.append({'alias': str(r + 1), 'score': repr(score),
+                       'weight': repr(1./realizations),
+                       'parameters': parameters})
+
+    photometry = []
+    for b, band in enumerate(bands):
+        band_times = [float(t) for t in times[band]]
+        # a light curve that fades away from day 1, offset in every band
+        curve = 19. + 0.3*b + 0.8*np.abs(np.array(band_times) - 1.)
+        if observed:
+            for t, mag in zip(band_times, curve.tolist()):
+                photometry.append({'band': band, 'e_magnitude': '0.02',
+                                   'instrument': 'DECam',
+                                   'magnitude': repr(mag),
+                                   'source': '1', 'system': 'AB',
+                                   'telescope': 'CTIO', 'time': repr(t),
+                                   'u_time': 'MJD'})
+        for r in range(realizations):
+            model = curve + 0.1*random.randn(len(band_times))
+            for t, mag in zip(band_times, model.tolist()):
+                photometry.append({'band': band, 'e_magnitude': '0.0',
+                                   'instrument': 'DECam',
+                                   'magnitude': repr(mag),
+                                   'model': '1', 'realization': str(r + 1),
+                                   'source': '1', 'time': repr(t),
+                                   'u_time': 'MJD'})
+
+    convergence = [{'kind': 'psrf', 'value': repr(1. + random.uniform()/10.)}]
+    event = {'name': name,
+             'sources': [{'bibcode': '2017arXiv170708132V', 'alias': '1'}],
+             'alias': [{'value': name, 'source': '1'}],
+             'models': [{'code': 'MOSFiT', 'name': name, 'source': '1',
+                         'realizations': models, 'convergence': convergence,
+                         'steps': str(realizations)}],
+             'photometry': photometry,
+             'schema': 'https://github.com/astrocatalogs/schema/README.md'}
+    return {name: event}
+
+
+def write_walkers(path, data=None, **kwargs):
+    '''
+    Writes data, by default walkers(**kwargs), to path, indented one
+    character per level like MOSFiT's tabs, and returns path
+    '''
+    if data is None:
+        data = walkers(**kwargs)
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=1)
+    return path
+
+
+def write_set(directory, free='theta', values=np.linspace(0, 1.57, 10),
+              **kwargs):
+    '''
+    A fitted Set: a run dir with products/walkers.json for every value of
+    the free parameter, and the run_paths file analyze.Set reads. Returns
+    the path of run_paths.
+    '''
+    run_paths = os.path.join(directory, 'run_paths')
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(run_paths, 'w') as f:
+        for n, value in enumerate(values):
+            run = os.path.join(os.path.abspath(directory),
+                               free + str(n), 'run')
+            write_walkers(os.path.join(run, 'products', 'walkers.json'),
+                          free=(free,), truths={free: value}, seed=n,
+                          **kwargs)
+            f.write(repr(float(value)) + ' ' + run + '\n')
+    return run_paths
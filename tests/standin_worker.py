@@ -0,0 +1,65 @@
+# MOSFiT Simulation Tools
+# standin_worker.py
+# python2
+
+# A worker for worker.WorkerPool that imitates MOSFiT in generative mode
+# without needing MOSFiT: it writes a products/walkers.json with one
+# photometry point per requested band and time (plus a few model times
+# that aren't observations, like MOSFiT does) and the given parameters.
+#
+#   pool = mst.worker.WorkerPool(4, command=[sys.executable,
+#                                            'standin_worker.py'])
+#   simulation.generate_input_data(..., pool=pool)
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'mosfitsimulationtools'))
+import worker
+
+
+def option(args, flag):
+    '''
+    The values that follow flag in args
+    '''
+    if flag not in args:
+        return []
+    values = []
+    for arg in args[args.index(flag) + 1:]:
+        if arg.startswith('-') and not arg[1:2].isdigit():
+            break
+        values.append(arg)
+    return values
+
+
+def fake_mosfit(args):
+    model = option(args, '-m')[0]
+    bands = option(args, '--band-list')
+    instrument = option(args, '--band-instruments')[0]
+    times = option(args, '--extra-times')
+    free = option(args, '-F')
+    params = dict((free[i], {'value': float(free[i + 1])})
+                  for i in range(0, len(free), 2))
+
+    photometry = []
+    per_band = len(times) // len(bands)
+    for b, band in enumerate(bands):
+        for t in times[b*per_band:(b + 1)*per_band] + ['0.5', '7.25']:
+            photometry.append({'time': t, 'band': band, 'magnitude': '21.5',
+                               'e_magnitude': '0.0', 'instrument': instrument,
+                               'realization': '1', 'model': '1',
+                               'source': '1', 'u_time': 'MJD'})
+
+    event = {'name': model, 'sources': [{'name': 'MOSFiT', 'alias': '1'}],
+             'models': [{'realizations': [{'parameters': params}]}],
+             'photometry': photometry}
+    if not os.path.isdir('products'):
+        os.mkdir('products')
+    with open(os.path.join('products', 'walkers.json'), 'w') as f:
+        json.dump({model: event}, f)
+
+
+if __name__ == '__main__':
+    worker.serve(fake_mosfit)
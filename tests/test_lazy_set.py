@@ -0,0 +1,54 @@
+# MOSFiT Simulation Tools
+# test_lazy_set.py
+# python2
+
+# A Set with a memory budget keeps the last good version of a simulation
+# when its walkers.json is rewritten into something that doesn't parse.
+# Runs on synthetic products, no MOSFiT needed.
+
+import os
+import shutil
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, os.path.join(HERE, 'benchmarks'))
+
+import numpy as np
+
+import mosfitsimulationtools as mst
+import synthetic
+
+
+def test_refresh_then_access():
+    directory = tempfile.mkdtemp(prefix='mst_test_')
+    try:
+        run_paths = synthetic.write_set(directory,
+                                        values=np.linspace(0, 1.57, 6),
+                                        realizations=40)
+        eager = mst.analyze.Set('theta', run_paths)
+        # room for about one simulation, so the others are moved out
+        results = mst.analyze.Set('theta', run_paths, memory_budget=50000)
+
+        # the first one is out of memory by now: break its file
+        broken = results.simulations[0].data_path
+        with open(broken, 'w') as f:
+            f.write('{"x": {"models": [{"realiz')
+        results.refresh()
+        assert list(results.get_errors()) == [0.0]
+
+        # still there, as it was
+        assert len(results.simulations) == 6
+        assert np.array_equal(results.simulations[0].get_samples(),
+                              eager.simulations[0].get_samples())
+        assert np.array_equal(results.get_summary(),
+                              eager.get_summary())
+        results.export(os.path.join(directory, 'set.store'))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    test_refresh_then_access()
+    print('OK')
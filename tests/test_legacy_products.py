@@ -0,0 +1,49 @@
+# MOSFiT Simulation Tools
+# test_legacy_products.py
+# python2
+
+# The input file made from a product generated before the times were passed
+# to MOSFiT exactly (as '|S5' strings) is the one that was made back then,
+# tests/test/theta0/theta0.json. No MOSFiT needed.
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+
+import mosfitsimulationtools as mst
+
+LEGACY = os.path.join(HERE, 'test', 'theta0')
+
+
+def test_legacy_input_file():
+    directory = tempfile.mkdtemp(prefix='mst_test_')
+    try:
+        # the settings of creation_test.mst.py
+        mock = mst.simulate.Single('theta0', num_nights=3, night_length=0.33,
+                                   band_offset=0.01, N_obs=4,
+                                   instrument='DECam', telescope='CTIO',
+                                   bands=['g', 'z'], S=100)
+        mock.path = os.path.join(directory, 'theta0')
+        os.makedirs(os.path.join(mock.path, 'products'))
+        shutil.copy(os.path.join(LEGACY, 'products', 'walkers.json'),
+                    os.path.join(mock.path, 'products'))
+
+        path, run = mock.generate_input_file(error=0.02)
+        with open(path, 'r') as f:
+            made = json.load(f)['theta0']['photometry']
+        with open(os.path.join(LEGACY, 'theta0.json'), 'r') as f:
+            expected = json.load(f)['theta0']['photometry']
+        assert len(made) == len(expected) == 26
+        assert made == expected
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    test_legacy_input_file()
+    print('OK')
@@ -0,0 +1,63 @@
+# MOSFiT Simulation Tools
+# test_streaming.py
+# python2
+
+# Reading a walkers.json with streaming=True gives the same Single as
+# loading the whole file, on the committed fits of tests/test, however the
+# file falls into chunks. No MOSFiT needed.
+
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+
+import numpy as np
+
+import mosfitsimulationtools as mst
+
+PRODUCTS = [(0.0, os.path.join(HERE, 'test', 'theta0', 'run', 'products',
+                               'walkers.json')),
+            (1.57, os.path.join(HERE, 'test', 'theta90', 'run', 'products',
+                                'walkers.json'))]
+
+
+def assert_same(eager, streamed):
+    assert eager.get_param_names() == streamed.get_param_names()
+    assert np.array_equal(eager.get_samples(), streamed.get_samples())
+    expected = eager.get_photometry().columns()
+    columns = streamed.get_photometry().columns()
+    assert sorted(expected) == sorted(columns)
+    for name in expected:
+        # nan == nan here
+        np.testing.assert_array_equal(expected[name], columns[name], name)
+
+
+def test_streaming_matches_eager():
+    for true_val, path in PRODUCTS:
+        for stride in (1, 3):
+            eager = mst.analyze.Single('theta', true_val, path, stride=stride)
+            streamed = mst.analyze.Single('theta', true_val, path,
+                                          streaming=True, stride=stride)
+            assert eager.get_num_realizations() > 0
+            assert_same(eager, streamed)
+
+
+def test_chunk_boundaries():
+    # chunks small enough that every kind of value is split somewhere
+    for true_val, path in PRODUCTS:
+        expected = mst.stream.read_walkers(
+            path, params=['theta'], free=True,
+            fields=mst.analyze.PhotometryTable.FIELDS)
+        for chunk_size in (3, 7, 1000):
+            data = mst.stream.read_walkers(
+                path, params=['theta'], free=True,
+                fields=mst.analyze.PhotometryTable.FIELDS,
+                chunk_size=chunk_size)
+            assert data == expected, chunk_size
+
+
+if __name__ == '__main__':
+    test_streaming_matches_eager()
+    test_chunk_boundaries()
+    print('OK')